@@ -1,4 +1,11 @@
 from api.settings import *
 from api.database import *
+from api.session import *
+from api.cache import *
+from api.ratelimit import *
+from api.results import *
+from api.broadcast import *
+from api.serializer import *
+from api.compression import *
 from api.toornament import *
 from api.ballchasing import *
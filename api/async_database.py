@@ -0,0 +1,113 @@
+import asyncio
+import os
+import traceback
+
+import asyncpg
+
+from api import settings, database
+
+_pool = None
+_pool_lock = None
+
+
+async def get_pool():
+    """プロセス共通の非同期コネクションプール取得
+
+    Returns:
+        Pool: asyncpg のコネクションプール
+    """
+    global _pool, _pool_lock
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    async with _pool_lock:
+        if _pool is None:
+            search_path = database.get_search_path()
+            _pool = await asyncpg.create_pool(
+                os.environ['DATABASE_URL'],
+                min_size=settings.ASYNC_DB_POOL_MIN_SIZE,
+                max_size=settings.ASYNC_DB_POOL_MAX_SIZE,
+                server_settings={'search_path': search_path} if search_path else None,
+            )
+        return _pool
+
+
+async def close_pool():
+    """非同期コネクションプールを閉じる"""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+async def fetch_all(query, *args):
+    """SELECT 結果の取得
+
+    Args:
+        query (str): SQL（パラメータは $1, $2, ...）
+        args: パラメータ
+
+    Returns:
+        List[dict]: 取得結果
+    """
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(query, *args)
+    return [dict(row) for row in rows]
+
+
+async def fetch_columns(query, *args):
+    """SELECT 結果を列ごとに取得
+
+    行ごとの dict は作らず、取得した行を列ごとのリストに転置する。
+
+    Args:
+        query (str): SQL（パラメータは $1, $2, ...）
+        args: パラメータ
+
+    Returns:
+        Tuple[List[str], dict]: 列名と、列名ごとの値のリスト
+    """
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        statement = await conn.prepare(query)
+        rows = await statement.fetch(*args)
+        columns = [attribute.name for attribute in statement.get_attributes()]
+    values = list(zip(*rows)) if rows else [()] * len(columns)
+    return columns, {column: list(value) for column, value in zip(columns, values)}
+
+
+async def listen(channel, callback):
+    """LISTEN ループ
+
+    プールとは別の専用接続で通知を待ち受け、通知ごとに callback(payload) を呼び出す。
+    接続が切れた場合は settings.DB_LISTEN_RETRY_INTERVAL 秒後に再接続する。
+    切断中の通知は受け取れないため、接続のたびに callback(None) を呼び出す。
+
+    Args:
+        channel (str): チャネル名
+        callback (Callable): 通知を受け取る関数（イベントループ上で呼び出される）
+    """
+    while True:
+        try:
+            conn = await asyncpg.connect(os.environ['DATABASE_URL'])
+        except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError):
+            traceback.print_exc()
+            await asyncio.sleep(settings.DB_LISTEN_RETRY_INTERVAL)
+            continue
+
+        closed = asyncio.get_event_loop().create_future()
+
+        def on_terminate(connection):
+            if not closed.done():
+                closed.set_result(None)
+
+        conn.add_termination_listener(on_terminate)
+        try:
+            await conn.add_listener(channel, lambda connection, pid, name, payload: callback(payload))
+            callback(None)
+            await closed
+        except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError):
+            traceback.print_exc()
+        finally:
+            await conn.close()
+        await asyncio.sleep(settings.DB_LISTEN_RETRY_INTERVAL)
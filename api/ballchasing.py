@@ -1,15 +1,314 @@
 import datetime
-import requests
+import hashlib
+import json
 import traceback
-from psycopg2 import extras
+from concurrent.futures import ThreadPoolExecutor
 
-from api import settings, database
+from api import settings, database, migrations, session, cache, ratelimit
+from api.results import result_cache
 from api.models.ballchasing import ReplayGroup
 
 
 class Ballchasing:
 
     BASE_URL = 'https://ballchasing.com/api'
+    CUMULATIVE_SEQS = [
+        'cumulative_id_seq',
+        'cumulative_core_id_seq',
+        'cumulative_boost_id_seq',
+        'cumulative_movement_id_seq',
+        'cumulative_positioning_id_seq',
+        'cumulative_demo_id_seq',
+    ]
+    GAME_AVERAGE_SEQS = [
+        'game_average_id_seq',
+        'game_average_core_id_seq',
+        'game_average_boost_id_seq',
+        'game_average_movement_id_seq',
+        'game_average_positioning_id_seq',
+        'game_average_demo_id_seq',
+    ]
+    GROUP_COLUMNS = [
+        'id',
+        'name',
+        'parent_group_id',
+        'created',
+    ]
+    PLAYER_COLUMNS = [
+        'id',
+        'name',
+        'team_id',
+        'platform',
+    ]
+    CUMULATIVE_COLUMNS = [
+        'id',
+        'group_id',
+        'player_id',
+        'games',
+        'wins',
+        'win_percentage',
+        'play_duration',
+        'core_id',
+        'boost_id',
+        'movement_id',
+        'positioning_id',
+        'demo_id',
+    ]
+    GAME_AVERAGE_COLUMNS = [
+        'id',
+        'group_id',
+        'player_id',
+        'core_id',
+        'boost_id',
+        'movement_id',
+        'positioning_id',
+        'demo_id',
+    ]
+    CORE_COLUMNS = [
+        'id',
+        'shots',
+        'shots_against',
+        'goals',
+        'goals_against',
+        'saves',
+        'assists',
+        'score',
+        'mvp',
+        'shooting_percentage',
+    ]
+    BOOST_COLUMNS = [
+        'id',
+        'bpm',
+        'bcpm',
+        'avg_amount',
+        'amount_collected',
+        'amount_stolen',
+        'amount_collected_big',
+        'amount_stolen_big',
+        'amount_collected_small',
+        'amount_stolen_small',
+        'count_collected_big',
+        'count_stolen_big',
+        'count_collected_small',
+        'count_stolen_small',
+        'time_zero_boost',
+        'percent_zero_boost',
+        'time_full_boost',
+        'percent_full_boost',
+        'amount_overfill',
+        'amount_overfill_stolen',
+        'amount_used_while_supersonic',
+        'time_boost_0_25',
+        'time_boost_25_50',
+        'time_boost_50_75',
+        'time_boost_75_100',
+        'percent_boost_0_25',
+        'percent_boost_25_50',
+        'percent_boost_50_75',
+        'percent_boost_75_100',
+    ]
+    MOVEMENT_COLUMNS = [
+        'id',
+        'avg_speed',
+        'total_distance',
+        'time_supersonic_speed',
+        'time_boost_speed',
+        'time_slow_speed',
+        'time_ground',
+        'time_low_air',
+        'time_high_air',
+        'time_powerslide',
+        'count_powerslide',
+        'avg_powerslide_duration',
+        'avg_speed_percentage',
+        'percent_slow_speed',
+        'percent_boost_speed',
+        'percent_supersonic_speed',
+        'percent_ground',
+        'percent_low_air',
+        'percent_high_air',
+    ]
+    POSITIONING_COLUMNS = [
+        'id',
+        'avg_distance_to_ball',
+        'avg_distance_to_ball_possession',
+        'avg_distance_to_ball_no_possession',
+        'time_defensive_third',
+        'time_neutral_third',
+        'time_offensive_third',
+        'time_defensive_half',
+        'time_offensive_half',
+        'time_behind_ball',
+        'time_infront_ball',
+        'time_most_back',
+        'time_most_forward',
+        'goals_against_while_last_defender',
+        'time_closest_to_ball',
+        'time_farthest_from_ball',
+        'percent_defensive_third',
+        'percent_offensive_third',
+        'percent_neutral_third',
+        'percent_defensive_half',
+        'percent_offensive_half',
+        'percent_behind_ball',
+        'percent_infront_ball',
+    ]
+    DEMO_COLUMNS = [
+        'id',
+        'inflicted',
+        'taken',
+    ]
+    # STORAGE_LAYOUT=wide の成績テーブル（累計・平均成績を 1 行にまとめる）
+    PLAYER_STAT_KEYS = [
+        'group_id',
+        'player_id',
+        'kind',
+    ]
+    PLAYER_STAT_COLUMNS = PLAYER_STAT_KEYS + [
+        'games',
+        'wins',
+        'win_percentage',
+        'play_duration',
+    ] + CORE_COLUMNS[1:] + BOOST_COLUMNS[1:] + MOVEMENT_COLUMNS[1:] + POSITIONING_COLUMNS[1:] + DEMO_COLUMNS[1:]
+    GROUP_SYNC_COLUMNS = [
+        'group_id',
+        'parent_group_id',
+        'fingerprint',
+        'synced_at',
+    ]
+    # スコア取得クエリの項目（項目名: SELECT 句の式）。fields で指定された項目だけを SELECT する
+    SCORES_BY_DAYS_EXPRESSIONS = {
+        'group_name': 'grp.name',
+        'player_name': 'ply.name',
+        'wins': 'cml.wins',
+        'score': 'cml_core.score',
+        'goals': 'cml_core.goals',
+        'shots': 'cml_core.shots',
+        'shooting_percentage': 'cml_core.shooting_percentage',
+        'assists': 'cml_core.assists',
+        'saves': 'cml_core.saves',
+        'group_created': 'grp.created',
+    }
+    SCORES_BY_DAYS_COLUMNS = list(SCORES_BY_DAYS_EXPRESSIONS)
+    SCORES_BY_DAYS_TEMPLATE = """
+        select
+            {columns}
+        from
+            groups grp
+        inner join cumulatives cml on
+            grp.id = cml.group_id
+        inner join cumulative_cores cml_core on
+            cml.core_id = cml_core.id
+        inner join players ply on
+            cml.player_id = ply.id
+        where
+            grp.parent_group_id is not null
+        order by
+            grp.created, cml_core.score desc
+    """
+    SCORES_ALL_COLUMNS = [
+        'team_id',
+        'team_name',
+        'player_name',
+        'wins',
+        'score',
+        'goals',
+        'shots',
+        'shooting_percentage',
+        'assists',
+        'saves',
+        'demos',
+        'wins_parameter',
+        'score_parameter',
+        'goals_parameter',
+        'shots_parameter',
+        'shooting_percentage_parameter',
+        'assists_parameter',
+        'saves_parameter',
+        'demos_parameter'
+    ]
+    SCORES_ALL_EXPRESSIONS = {column: column for column in SCORES_ALL_COLUMNS}
+    SCORES_ALL_TEMPLATE = """
+        select
+            {columns}
+        from
+            scores_all
+        order by
+            score desc
+    """
+
+    # 指定チームの選手のスコア（asyncpg 用。$1 はチームIDの配列）
+    SCORES_BY_TEAMS_TEMPLATE = """
+        select
+            {columns}
+        from
+            scores_all
+        where
+            team_id = any($1::varchar[])
+        order by
+            score desc
+    """
+
+    # 全インスタンスで共有するレート制限
+    rate_limiter = ratelimit.RateLimiter(settings.BCS_RATE_LIMIT, settings.BCS_RATE_BURST, settings.BCS_MAX_WORKERS)
+
+    @staticmethod
+    def build_scores_sql(template, expressions, fields=None):
+        """スコア取得 SQL 生成
+
+        Args:
+            template (str): SQL（SELECT 句の項目は {columns}）
+            expressions (dict): 項目名ごとの SELECT 句の式
+            fields (List[str]): 取得する項目（expressions のキーで検証済み。None の場合は全項目）
+
+        Returns:
+            str: SQL
+        """
+        columns = [
+            expressions[name] if expressions[name].split('.')[-1] == name else f'{expressions[name]} as {name}'
+            for name in fields or expressions
+        ]
+        return template.format(columns=', '.join(columns))
+
+    @classmethod
+    def scores_by_days_sql(cls, fields=None):
+        """Dayごとのスコア取得 SQL
+
+        Args:
+            fields (List[str]): 取得する項目（None の場合は全項目）
+
+        Returns:
+            str: SQL
+        """
+        return cls.build_scores_sql(cls.SCORES_BY_DAYS_TEMPLATE, cls.SCORES_BY_DAYS_EXPRESSIONS, fields)
+
+    @classmethod
+    def scores_all_sql(cls, fields=None):
+        """全試合スコア取得 SQL
+
+        Args:
+            fields (List[str]): 取得する項目（None の場合は全項目）
+
+        Returns:
+            str: SQL
+        """
+        return cls.build_scores_sql(cls.SCORES_ALL_TEMPLATE, cls.SCORES_ALL_EXPRESSIONS, fields)
+
+    @classmethod
+    def scores_by_teams_sql(cls, fields=None):
+        """指定チームの選手のスコア取得 SQL（asyncpg 用。$1 はチームIDの配列）
+
+        Args:
+            fields (List[str]): 取得する項目（None の場合は全項目）
+
+        Returns:
+            str: SQL
+        """
+        return cls.build_scores_sql(cls.SCORES_BY_TEAMS_TEMPLATE, cls.SCORES_ALL_EXPRESSIONS, fields)
+
+    def __init__(self, *args, **kwargs):
+        self.session = session.create_session()
+        self.cache = cache.ResponseCache()
 
     def send_request(self, url, headers={}, method=settings.REQUEST_METHOD['get'], params=None):
         """リクエスト送信
@@ -30,7 +329,38 @@ class Ballchasing:
         req_headers = {**base_headers, **headers}
 
         if method == settings.REQUEST_METHOD['get']:
-            return requests.get(request_url, headers=req_headers, params=params)
+            def fetch(validators):
+                return self.send_rate_limited_request(request_url, {**req_headers, **validators}, params)
+            return self.cache.request(request_url, params, headers, fetch)
+
+    def send_rate_limited_request(self, request_url, headers, params):
+        """レート制限付きリクエスト送信
+
+        429 を受けた場合は Retry-After に従って待機し、settings.BCS_MAX_RETRIES 回まで再試行する。
+
+        Args:
+            request_url (str): URL
+            headers (dict): Header情報
+            params (dict): クエリパラメータ
+
+        Returns:
+            Response: レスポンス
+        """
+        for attempt in range(settings.BCS_MAX_RETRIES + 1):
+            if attempt:
+                self.rate_limiter.retried()
+            self.rate_limiter.acquire()
+            try:
+                r = self.session.get(request_url, headers=headers, params=params, timeout=settings.HTTP_TIMEOUT)
+            except Exception:
+                self.rate_limiter.release()
+                raise
+            if r.status_code != 429:
+                self.rate_limiter.release()
+                return r
+            retry_after = ratelimit.parse_retry_after(r.headers.get('Retry-After'))
+            self.rate_limiter.release(throttled=True, retry_after=retry_after)
+        return r
 
     def get_group(self, group_id):
         """グループデータ取得
@@ -48,14 +378,14 @@ class Ballchasing:
         replay_group = ReplayGroup(**r.json())
         return replay_group
 
-    def get_group_children(self, group_id):
-        """グループの子グループデータ取得
+    def list_group_children(self, group_id):
+        """子グループ一覧取得
 
         Args:
             group_id (int): 親グループID
 
         Returns:
-            List[Group]: 子グループデータ
+            List[dict]: 子グループ一覧（created 昇順）
         """
 
         url = f'/groups'
@@ -65,161 +395,442 @@ class Ballchasing:
             'sort-dir': 'asc'
         }
         r = self.send_request(url, params=params)
-        replay_groups = []
-        for x in r.json()['list']:
-            group = self.get_group(x['id'])
-            replay_groups.append(group)
-        return replay_groups
+        return r.json()['list']
+
+    def get_groups(self, group_ids, max_workers=None):
+        """複数グループデータ取得
+
+        max_workers 件まで並列に取得する。戻り値の順序は group_ids のまま。
+
+        Args:
+            group_ids (List[str]): グループID
+            max_workers (int): 同時リクエスト数（省略時は settings.BCS_MAX_WORKERS）
 
-    def init_db(self, group_id, background_task_id):
+        Returns:
+            List[Group]: グループデータ
+        """
+        if not group_ids:
+            return []
+
+        max_workers = max_workers or settings.BCS_MAX_WORKERS
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(group_ids))) as executor:
+            return list(executor.map(self.get_group, group_ids))
+
+    def get_group_children(self, group_id, max_workers=None):
+        """グループの子グループデータ取得
+
+        子グループの詳細は max_workers 件まで並列に取得する。
+        戻り値の順序は一覧取得時の created 昇順のまま。
+
+        Args:
+            group_id (int): 親グループID
+            max_workers (int): 同時リクエスト数（省略時は settings.BCS_MAX_WORKERS）
+
+        Returns:
+            List[Group]: 子グループデータ
+        """
+        child_ids = [x['id'] for x in self.list_group_children(group_id)]
+        return self.get_groups(child_ids, max_workers)
+
+    def init_db(self, group_id, background_task_id, incremental=False):
         """データベース初期化
 
         Args:
             group_id (int): 親グループID
+            background_task_id (int): バックグラウンドタスクID
+            incremental (bool): True の場合は差分同期
         """
+        task_name = 'sync_db' if incremental else 'init_db'
+        migrations.migrate_database()
         with database.get_connection() as conn:
             with conn.cursor() as cursor:
                 # Background Task Status
-                values = (background_task_id, 'ballchasing init_db started', datetime.datetime.now())
+                values = (background_task_id, f'ballchasing {task_name} started', datetime.datetime.now())
                 cursor.execute("INSERT INTO background_tasks (id, status, created_at) VALUES (%s, %s, %s)", values)
 
         st = None
-        with database.get_connection() as conn:
-            with conn.cursor() as cursor:
-                try:
-                    tables = [
-                        'groups',
-                        'players',
-                        'cumulatives',
-                        'cumulative_cores',
-                        'cumulative_boosts',
-                        'cumulative_movements',
-                        'cumulative_positionings',
-                        'cumulative_demos',
-                        'game_averages',
-                        'game_average_cores',
-                        'game_average_boosts',
-                        'game_average_movements',
-                        'game_average_positionings',
-                        'game_average_demos'
-                    ]
-                    for table in tables:
-                        cursor.execute(f'TRUNCATE TABLE {table}')
-
-                    # グループ情報書き換え
-                    group = self.get_group(group_id)
-                    self.init_db_group(cursor, group, None)
-
-                    cumulative_values = {
-                        'base': [],
-                        'core': [],
-                        'boost': [],
-                        'movement': [],
-                        'positioning': [],
-                        'demo': [],
-                    }
-                    game_average_values = {
-                        'base': [],
-                        'core': [],
-                        'boost': [],
-                        'movement': [],
-                        'positioning': [],
-                        'demo': [],
-                    }
-
-                    # プレイヤー情報書き換え
-                    for player in group.players:
-                        self.init_db_player(cursor, player)
-                        self.init_db_cumulative(cursor, group, player, cumulative_values)
-                        self.init_db_game_average(cursor, group, player, game_average_values)
-
-                    # 子グループ情報書き換え
-                    group_children = self.get_group_children(group_id)
-                    for child in group_children:
-                        self.init_db_group(cursor, child, group_id)
-
-                        for player in child.players:
-                            self.init_db_cumulative(cursor, child, player, cumulative_values)
-                            self.init_db_game_average(cursor, child, player, game_average_values)
-
-                    # Bulk Insert
-                    self.bulk_insert_cumulative(cursor, cumulative_values)
-                    self.bulk_insert_game_average(cursor, game_average_values)
-
-                except:
-                    st = traceback.format_exc()
+        try:
+            # 外部 API の取得中は接続・トランザクションを保持しない
+            fetched = self.fetch_sync_targets(group_id) if incremental else self.fetch_groups(group_id)
+            with database.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    if incremental:
+                        self.sync_db(cursor, group_id, fetched)
+                    else:
+                        self.reload_db(cursor, group_id, fetched)
+                    self.refresh_scores_all(cursor)
+                    database.notify(cursor, 'scores')
+        except:
+            st = traceback.format_exc()
+
+        # コミットしたデータを返すようにレスポンスキャッシュを無効化
+        if st is None:
+            result_cache.bump()
 
         with database.get_connection() as conn:
             with conn.cursor() as cursor:
                 # Background Task Status
-                status = 'ballchasing init_db ended' if st is None else f'ballchasing init_db error: {st}'
+                status = f'ballchasing {task_name} ended' if st is None else f'ballchasing {task_name} error: {st}'
                 values = (background_task_id, status, datetime.datetime.now())
                 cursor.execute("INSERT INTO background_tasks (id, status, created_at) VALUES (%s, %s, %s)", values)
 
-    def create_format_str(self, values):
-        """フォーマット文字列生成
+    def fetch_groups(self, group_id):
+        """全件再登録のグループ情報取得
+
+        Args:
+            group_id (int): 親グループID
+
+        Returns:
+            tuple: 親グループ、子グループ一覧、子グループデータ
+        """
+        group = self.get_group(group_id)
+        group_children_list = self.list_group_children(group_id)
+        group_children = self.get_groups([x['id'] for x in group_children_list])
+        return group, group_children_list, group_children
+
+    def fetch_sync_targets(self, group_id):
+        """差分同期のグループ情報取得
+
+        取り込み済みで一覧情報に変化のない子グループは取得しない。
+        最新の子グループは試合中に更新されるため毎回取得する。
+        取り込み状況は取得前に短いトランザクションで読み、外部 API の取得中は接続を保持しない。
+
+        Args:
+            group_id (int): 親グループID
+
+        Returns:
+            tuple: 親グループ、子グループ一覧、同期対象の子グループ一覧、同期対象の子グループデータ
+        """
+        with database.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT group_id, fingerprint FROM group_syncs WHERE parent_group_id = %s", (group_id,))
+                synced = dict(cursor.fetchall())
+
+        group_children_list = self.list_group_children(group_id)
+        latest_id = group_children_list[-1]['id'] if group_children_list else None
+        targets = [
+            x for x in group_children_list
+            if x['id'] == latest_id or synced.get(x['id']) != self.create_fingerprint(x)
+        ]
+        group = self.get_group(group_id)
+        group_children = self.get_groups([x['id'] for x in targets])
+        return group, group_children_list, targets, group_children
+
+    def reload_db(self, cursor, group_id, fetched=None):
+        """全件再登録
+
+        ステージングテーブルに登録してから本テーブルと入れ替える。
+
+        Args:
+            cursor (obj): cursor
+            group_id (int): 親グループID
+            fetched (tuple): fetch_groups の結果（省略時は取得する）
+        """
+        if settings.STORAGE_LAYOUT == 'wide':
+            tables = [
+                'groups',
+                'players',
+                'player_stats',
+                'group_syncs'
+            ]
+        else:
+            tables = [
+                'groups',
+                'players',
+                'cumulatives',
+                'cumulative_cores',
+                'cumulative_boosts',
+                'cumulative_movements',
+                'cumulative_positionings',
+                'cumulative_demos',
+                'game_averages',
+                'game_average_cores',
+                'game_average_boosts',
+                'game_average_movements',
+                'game_average_positionings',
+                'game_average_demos',
+                'group_syncs'
+            ]
+
+        # グループ情報取得
+        group, group_children_list, group_children = fetched or self.fetch_groups(group_id)
+
+        # Bulk Insert
+        prefix = database.STAGING_PREFIX
+        database.create_staging_tables(cursor, tables)
+        values = self.create_values(cursor, group, group_children)
+        database.bulk_insert(cursor, f'{prefix}groups', self.GROUP_COLUMNS, values['group'])
+        database.bulk_insert(cursor, f'{prefix}players', self.PLAYER_COLUMNS, values['player'])
+        self.bulk_insert_stats(cursor, values, table_prefix=prefix)
+        self.record_group_syncs(cursor, group_id, group_children_list, table_prefix=prefix)
+
+        # 本テーブルと入れ替え
+        database.swap_staging_tables(cursor, tables)
+
+    def sync_db(self, cursor, group_id, fetched=None):
+        """差分同期
+
+        fetch_sync_targets で取得した子グループと親グループの集計値は既存行を UPSERT で更新する。
+        一覧からなくなった子グループの取り込み状況は削除する。
+
+        Args:
+            cursor (obj): cursor
+            group_id (int): 親グループID
+            fetched (tuple): fetch_sync_targets の結果（省略時は取得する）
+        """
+        group, group_children_list, targets, group_children = fetched or self.fetch_sync_targets(group_id)
+
+        # 既存レコードの ID を再利用して UPSERT（wide レイアウトは (グループ, プレイヤー, 種別) で UPSERT する）
+        record_ids = None
+        if settings.STORAGE_LAYOUT != 'wide':
+            group_ids = [group.id, *[child.id for child in group_children]]
+            record_ids = {
+                'cumulatives': self.get_record_ids(cursor, 'cumulatives', group_ids),
+                'game_averages': self.get_record_ids(cursor, 'game_averages', group_ids),
+            }
+        values = self.create_values(cursor, group, group_children, record_ids)
+        database.bulk_upsert(cursor, 'groups', self.GROUP_COLUMNS, values['group'])
+        database.bulk_upsert(cursor, 'players', self.PLAYER_COLUMNS, values['player'])
+        self.bulk_insert_stats(cursor, values, upsert=True)
+        self.record_group_syncs(cursor, group_id, targets, upsert=True)
+        self.prune_group_syncs(cursor, group_id, group_children_list)
+
+    def create_values(self, cursor, group, group_children, record_ids=None):
+        """登録データ生成
+
+        Args:
+            cursor (obj): cursor
+            group (ReplayGroup): 親グループ情報
+            group_children (List[ReplayGroup]): 子グループ情報
+            record_ids (dict): 既存レコードの ID（get_record_ids の結果）
+
+        Returns:
+            dict: テーブルごとの登録データ
+        """
+        records = [(group, player) for player in group.players]
+        records += [(child, player) for child in group_children for player in child.players]
+
+        # グループ、プレイヤー情報
+        values = {
+            'group': [],
+            'player': [],
+        }
+        self.init_db_group(cursor, group, None, values['group'])
+        for child in group_children:
+            self.init_db_group(cursor, child, group.id, values['group'])
+        for player in group.players:
+            self.init_db_player(cursor, player, values['player'])
+
+        # 成績情報（wide レイアウトは SEQ を使わない）
+        if settings.STORAGE_LAYOUT == 'wide':
+            values['player_stat'] = [
+                self.init_db_player_stat(cursor, record_group, player, kind)
+                for record_group, player in records
+                for kind in ['cumulative', 'game_average']
+            ]
+            return values
+
+        record_ids = record_ids or {'cumulatives': {}, 'game_averages': {}}
+        keys = [(str(g.id), str(player.id)) for g, player in records]
+
+        # SEQ 一括確保
+        cumulative_count = sum(1 for key in keys if key not in record_ids['cumulatives'])
+        game_average_count = sum(1 for key in keys if key not in record_ids['game_averages'])
+        cumulative_seqs = self.reserve_seqs(cursor, self.CUMULATIVE_SEQS, cumulative_count)
+        game_average_seqs = self.reserve_seqs(cursor, self.GAME_AVERAGE_SEQS, game_average_count)
+
+        values['cumulative'] = {
+            'base': [],
+            'core': [],
+            'boost': [],
+            'movement': [],
+            'positioning': [],
+            'demo': [],
+        }
+        values['game_average'] = {
+            'base': [],
+            'core': [],
+            'boost': [],
+            'movement': [],
+            'positioning': [],
+            'demo': [],
+        }
+        for (record_group, player), key in zip(records, keys):
+            seqs = self.existing_seqs(self.CUMULATIVE_SEQS, record_ids['cumulatives'].get(key)) or cumulative_seqs
+            self.init_db_cumulative(cursor, record_group, player, values['cumulative'], seqs)
+            seqs = self.existing_seqs(self.GAME_AVERAGE_SEQS, record_ids['game_averages'].get(key)) or game_average_seqs
+            self.init_db_game_average(cursor, record_group, player, values['game_average'], seqs)
+
+        return values
+
+    def create_fingerprint(self, group_summary):
+        """子グループ一覧情報のフィンガープリント生成
+
+        Args:
+            group_summary (dict): 子グループ一覧の 1 件
+
+        Returns:
+            str: フィンガープリント
+        """
+        data = json.dumps(group_summary, sort_keys=True).encode()
+        return hashlib.sha1(data).hexdigest()
+
+    def record_group_syncs(self, cursor, group_id, group_children_list, upsert=False, table_prefix=''):
+        """子グループの取り込み状況記録
+
+        Args:
+            cursor (obj): cursor
+            group_id (int): 親グループID
+            group_children_list (List[dict]): 取り込んだ子グループ一覧
+            upsert (bool): True の場合は記録済みの子グループを更新
+            table_prefix (str): 登録先テーブル名の接頭辞
+        """
+        synced_at = datetime.datetime.now()
+        values = [(x['id'], group_id, self.create_fingerprint(x), synced_at) for x in group_children_list]
+        if upsert:
+            database.bulk_upsert(cursor, f'{table_prefix}group_syncs', self.GROUP_SYNC_COLUMNS, values, keys=['group_id'])
+        else:
+            database.bulk_insert(cursor, f'{table_prefix}group_syncs', self.GROUP_SYNC_COLUMNS, values)
+
+    def prune_group_syncs(self, cursor, group_id, group_children_list):
+        """一覧からなくなった子グループの取り込み状況削除
+
+        Args:
+            cursor (obj): cursor
+            group_id (int): 親グループID
+            group_children_list (List[dict]): 現在の子グループ一覧
+        """
+        cursor.execute(
+            "DELETE FROM group_syncs WHERE parent_group_id = %s AND NOT (group_id = ANY(%s))",
+            (group_id, [x['id'] for x in group_children_list])
+        )
+
+    def get_record_ids(self, cursor, table, group_ids):
+        """既存成績レコードの ID 取得
+
+        Args:
+            cursor (obj): cursor
+            table (str): cumulatives または game_averages
+            group_ids (List[str]): グループID
+
+        Returns:
+            dict: (group_id, player_id) ごとの ID（id, core_id, boost_id, movement_id, positioning_id, demo_id）
+        """
+        cursor.execute(
+            f"SELECT group_id, player_id, id, core_id, boost_id, movement_id, positioning_id, demo_id FROM {table} WHERE group_id = ANY(%s)",
+            (list(group_ids),)
+        )
+        return {(str(row[0]), str(row[1])): row[2:] for row in cursor.fetchall()}
+
+    def existing_seqs(self, seq_names, ids):
+        """既存レコードの ID を reserve_seqs と同じ形式に変換
 
         Args:
-            values (array): values
+            seq_names (List[str]): シーケンス名
+            ids (tuple): 既存レコードの ID
 
         Returns:
-            str: フォーマット文字列
+            dict: シーケンス名ごとの SEQ イテレータ（ids がなければ None）
         """
-        return "%s" + ", %s" * (len(values) - 1)
+        if not ids:
+            return None
+        return {seq_name: iter([id]) for seq_name, id in zip(seq_names, ids)}
 
-    def init_db_group(self, cursor, group, parent_group_id):
+    def init_db_group(self, cursor, group, parent_group_id, group_values):
         """グループ情報初期化
 
         Args:
             cursor (obj): cursor
             group (ReplayGroup): グループ情報
             parent_group_id (str): 親グループID
+            group_values (array): 登録データ
         """
-        values = (group.id, group.name, parent_group_id, group.created)
-        format_str = self.create_format_str(values)
-        cursor.execute(f"INSERT INTO groups (id, name, parent_group_id, created) VALUES ({format_str})", values)
+        values = (group.id, group.name, parent_group_id, database.to_utc_timestamp(group.created))
+        group_values.append(values)
 
-    def init_db_player(self, cursor, player):
+    def init_db_player(self, cursor, player, player_values):
         """プレイヤー情報初期化
 
         Args:
             cursor (obj): cursor
             player (Player): プレイヤー情報
+            player_values (array): 登録データ
         """
         values = (player.id, player.name, player.team, player.platform)
-        format_str = self.create_format_str(values)
-        cursor.execute(f"INSERT INTO players (id, name, team_id, platform) VALUES ({format_str})", values)
+        player_values.append(values)
+
+    def reserve_seqs(self, cursor, seq_names, count):
+        """SEQ一括取得
 
-    def get_next_seq(self, cursor, seq_name):
-        """SEQ取得
+        複数シーケンスの値を count 件ずつ 1 クエリでまとめて確保する。
 
         Args:
             cursor (obj): cursor
-            seq_name (str): シーケンス名
+            seq_names (List[str]): シーケンス名
+            count (int): 確保する件数
 
         Returns:
-            int: SEQ
+            dict: シーケンス名ごとの SEQ イテレータ
         """
-        cursor.execute(f"SELECT NEXTVAL('{seq_name}')")
-        return cursor.fetchone()[0]
+        columns = ', '.join(f"NEXTVAL('{seq_name}')" for seq_name in seq_names)
+        cursor.execute(f"SELECT {columns} FROM generate_series(1, %s)", (count,))
+        seqs = list(zip(*cursor.fetchall())) or [()] * len(seq_names)
+        return {seq_name: iter(ids) for seq_name, ids in zip(seq_names, seqs)}
+
+    def init_db_player_stat(self, cursor, group, player, kind):
+        """成績初期化（wide レイアウト）
+
+        Args:
+            cursor (obj): cursor
+            group (ReplayGroup): グループ情報
+            player (Player): プレイヤー情報
+            kind (str): cumulative または game_average
 
-    def init_db_cumulative(self, cursor, group, player, cumulative_values):
+        Returns:
+            tuple: 登録データ（PLAYER_STAT_COLUMNS の順）
+        """
+        if kind == 'cumulative':
+            cumulative = player.cumulative
+            base = (cumulative.games, cumulative.wins, cumulative.win_percentage, cumulative.play_duration)
+            stats = [
+                self.init_db_cumulative_core(cursor, player, None),
+                self.init_db_cumulative_boost(cursor, player, None),
+                self.init_db_cumulative_movement(cursor, player, None),
+                self.init_db_cumulative_positioning(cursor, player, None),
+                self.init_db_cumulative_demo(cursor, player, None),
+            ]
+        else:
+            base = (None, None, None, None)
+            stats = [
+                self.init_db_game_average_core(cursor, player, None),
+                self.init_db_game_average_boost(cursor, player, None),
+                self.init_db_game_average_movement(cursor, player, None),
+                self.init_db_game_average_positioning(cursor, player, None),
+                self.init_db_game_average_demo(cursor, player, None),
+            ]
+
+        # 各成績の先頭は ID のため除く
+        return (group.id, player.id, kind, *base, *[value for values in stats for value in values[1:]])
+
+    def init_db_cumulative(self, cursor, group, player, cumulative_values, seqs):
         """累計成績初期化
 
         Args:
             cursor (obj): cursor
             group (ReplayGroup): グループ情報
             player (Player): プレイヤー情報
+            cumulative_values (dict): 登録データ
+            seqs (dict): reserve_seqs で確保した SEQ
         """
-        id = self.get_next_seq(cursor, 'cumulative_id_seq')
+        id = next(seqs['cumulative_id_seq'])
         group_id = group.id
         player_id = player.id
         cumulative = player.cumulative
-        core_id = self.get_next_seq(cursor, 'cumulative_core_id_seq')
-        boost_id = self.get_next_seq(cursor, 'cumulative_boost_id_seq')
-        movement_id = self.get_next_seq(cursor, 'cumulative_movement_id_seq')
-        positioning_id = self.get_next_seq(cursor, 'cumulative_positioning_id_seq')
-        demo_id = self.get_next_seq(cursor, 'cumulative_demo_id_seq')
+        core_id = next(seqs['cumulative_core_id_seq'])
+        boost_id = next(seqs['cumulative_boost_id_seq'])
+        movement_id = next(seqs['cumulative_movement_id_seq'])
+        positioning_id = next(seqs['cumulative_positioning_id_seq'])
+        demo_id = next(seqs['cumulative_demo_id_seq'])
 
         values = (
             id,
@@ -393,23 +1004,25 @@ class Ballchasing:
         )
         return values
 
-    def init_db_game_average(self, cursor, group, player, game_average_values):
+    def init_db_game_average(self, cursor, group, player, game_average_values, seqs):
         """平均成績初期化
 
         Args:
             cursor (obj): cursor
             group (ReplayGroup): グループ情報
             player (Player): プレイヤー情報
+            game_average_values (dict): 登録データ
+            seqs (dict): reserve_seqs で確保した SEQ
         """
-        id = self.get_next_seq(cursor, 'game_average_id_seq')
+        id = next(seqs['game_average_id_seq'])
         group_id = group.id
         player_id = player.id
         game_average = player.game_average
-        core_id = self.get_next_seq(cursor, 'game_average_core_id_seq')
-        boost_id = self.get_next_seq(cursor, 'game_average_boost_id_seq')
-        movement_id = self.get_next_seq(cursor, 'game_average_movement_id_seq')
-        positioning_id = self.get_next_seq(cursor, 'game_average_positioning_id_seq')
-        demo_id = self.get_next_seq(cursor, 'game_average_demo_id_seq')
+        core_id = next(seqs['game_average_core_id_seq'])
+        boost_id = next(seqs['game_average_boost_id_seq'])
+        movement_id = next(seqs['game_average_movement_id_seq'])
+        positioning_id = next(seqs['game_average_positioning_id_seq'])
+        demo_id = next(seqs['game_average_demo_id_seq'])
 
         values = (
             id,
@@ -579,125 +1192,89 @@ class Ballchasing:
         )
         return values
 
-    def bulk_insert_cumulative(self, cursor, values):
-        """累計成績 BULK INSERT
+    def bulk_insert_stats(self, cursor, values, upsert=False, table_prefix=''):
+        """成績 BULK INSERT
 
         Args:
-            cursor ([type]): [description]
-            values ([type]): [description]
+            cursor (obj): cursor
+            values (dict): create_values の登録データ
+            upsert (bool): True の場合は既存の行を更新
+            table_prefix (str): 登録先テーブル名の接頭辞
         """
-        extras.execute_values(
-            cursor, "INSERT INTO cumulatives (id, group_id, player_id, games, wins, win_percentage, play_duration, core_id, boost_id, movement_id, positioning_id, demo_id) VALUES %s", values['base'])
-        extras.execute_values(
-            cursor, "INSERT INTO cumulative_cores (id, shots, shots_against, goals, goals_against, saves, assists, score, mvp, shooting_percentage) VALUES %s", values['core'])
-        extras.execute_values(
-            cursor, "INSERT INTO cumulative_boosts (id, bpm, bcpm, avg_amount, amount_collected, amount_stolen, amount_collected_big, amount_stolen_big, amount_collected_small, amount_stolen_small, count_collected_big, count_stolen_big, count_collected_small, count_stolen_small, time_zero_boost, percent_zero_boost, time_full_boost, percent_full_boost, amount_overfill, amount_overfill_stolen, amount_used_while_supersonic, time_boost_0_25, time_boost_25_50, time_boost_50_75, time_boost_75_100, percent_boost_0_25, percent_boost_25_50, percent_boost_50_75, percent_boost_75_100) VALUES %s", values['boost'])
-        extras.execute_values(
-            cursor, "INSERT INTO cumulative_movements (id, avg_speed, total_distance, time_supersonic_speed, time_boost_speed, time_slow_speed, time_ground, time_low_air, time_high_air, time_powerslide, count_powerslide, avg_powerslide_duration, avg_speed_percentage, percent_slow_speed, percent_boost_speed, percent_supersonic_speed, percent_ground, percent_low_air, percent_high_air) VALUES %s", values['movement'])
-        extras.execute_values(
-            cursor, "INSERT INTO cumulative_positionings (id, avg_distance_to_ball, avg_distance_to_ball_possession, avg_distance_to_ball_no_possession, time_defensive_third, time_neutral_third, time_offensive_third, time_defensive_half, time_offensive_half, time_behind_ball, time_infront_ball, time_most_back, time_most_forward, goals_against_while_last_defender, time_closest_to_ball, time_farthest_from_ball, percent_defensive_third, percent_offensive_third, percent_neutral_third, percent_defensive_half, percent_offensive_half, percent_behind_ball, percent_infront_ball) VALUES %s", values['positioning'])
-        extras.execute_values(
-            cursor, "INSERT INTO cumulative_demos (id, inflicted, taken) VALUES %s", values['demo'])
+        if settings.STORAGE_LAYOUT == 'wide':
+            table = f'{table_prefix}player_stats'
+            if upsert:
+                database.bulk_upsert(cursor, table, self.PLAYER_STAT_COLUMNS, values['player_stat'], keys=self.PLAYER_STAT_KEYS)
+            else:
+                database.bulk_insert(cursor, table, self.PLAYER_STAT_COLUMNS, values['player_stat'])
+            return
+
+        self.bulk_insert_cumulative(cursor, values['cumulative'], upsert=upsert, table_prefix=table_prefix)
+        self.bulk_insert_game_average(cursor, values['game_average'], upsert=upsert, table_prefix=table_prefix)
+
+    def bulk_insert_cumulative(self, cursor, values, upsert=False, table_prefix=''):
+        """累計成績 BULK INSERT
 
-    def bulk_insert_game_average(self, cursor, values):
+        Args:
+            cursor (obj): cursor
+            values (dict): 登録データ
+            upsert (bool): True の場合は ID が重複する行を更新
+            table_prefix (str): 登録先テーブル名の接頭辞
+        """
+        write = database.bulk_upsert if upsert else database.bulk_insert
+        write(cursor, f'{table_prefix}cumulatives', self.CUMULATIVE_COLUMNS, values['base'])
+        write(cursor, f'{table_prefix}cumulative_cores', self.CORE_COLUMNS, values['core'])
+        write(cursor, f'{table_prefix}cumulative_boosts', self.BOOST_COLUMNS, values['boost'])
+        write(cursor, f'{table_prefix}cumulative_movements', self.MOVEMENT_COLUMNS, values['movement'])
+        write(cursor, f'{table_prefix}cumulative_positionings', self.POSITIONING_COLUMNS, values['positioning'])
+        write(cursor, f'{table_prefix}cumulative_demos', self.DEMO_COLUMNS, values['demo'])
+
+    def bulk_insert_game_average(self, cursor, values, upsert=False, table_prefix=''):
         """平均成績 BULK INSERT
 
         Args:
-            cursor ([type]): [description]
-            values ([type]): [description]
+            cursor (obj): cursor
+            values (dict): 登録データ
+            upsert (bool): True の場合は ID が重複する行を更新
+            table_prefix (str): 登録先テーブル名の接頭辞
         """
-        extras.execute_values(
-            cursor, "INSERT INTO game_averages (id, group_id, player_id, core_id, boost_id, movement_id, positioning_id, demo_id) VALUES %s", values['base'])
-        extras.execute_values(
-            cursor, "INSERT INTO game_average_cores (id, shots, shots_against, goals, goals_against, saves, assists, score, mvp, shooting_percentage) VALUES %s", values['core'])
-        extras.execute_values(
-            cursor, "INSERT INTO game_average_boosts (id, bpm, bcpm, avg_amount, amount_collected, amount_stolen, amount_collected_big, amount_stolen_big, amount_collected_small, amount_stolen_small, count_collected_big, count_stolen_big, count_collected_small, count_stolen_small, time_zero_boost, percent_zero_boost, time_full_boost, percent_full_boost, amount_overfill, amount_overfill_stolen, amount_used_while_supersonic, time_boost_0_25, time_boost_25_50, time_boost_50_75, time_boost_75_100, percent_boost_0_25, percent_boost_25_50, percent_boost_50_75, percent_boost_75_100) VALUES %s", values['boost'])
-        extras.execute_values(
-            cursor, "INSERT INTO game_average_movements (id, avg_speed, total_distance, time_supersonic_speed, time_boost_speed, time_slow_speed, time_ground, time_low_air, time_high_air, time_powerslide, count_powerslide, avg_powerslide_duration, avg_speed_percentage, percent_slow_speed, percent_boost_speed, percent_supersonic_speed, percent_ground, percent_low_air, percent_high_air) VALUES %s", values['movement'])
-        extras.execute_values(
-            cursor, "INSERT INTO game_average_positionings (id, avg_distance_to_ball, avg_distance_to_ball_possession, avg_distance_to_ball_no_possession, time_defensive_third, time_neutral_third, time_offensive_third, time_defensive_half, time_offensive_half, time_behind_ball, time_infront_ball, time_most_back, time_most_forward, goals_against_while_last_defender, time_closest_to_ball, time_farthest_from_ball, percent_defensive_third, percent_offensive_third, percent_neutral_third, percent_defensive_half, percent_offensive_half, percent_behind_ball, percent_infront_ball) VALUES %s", values['positioning'])
-        extras.execute_values(
-            cursor, "INSERT INTO game_average_demos (id, inflicted, taken) VALUES %s", values['demo'])
+        write = database.bulk_upsert if upsert else database.bulk_insert
+        write(cursor, f'{table_prefix}game_averages', self.GAME_AVERAGE_COLUMNS, values['base'])
+        write(cursor, f'{table_prefix}game_average_cores', self.CORE_COLUMNS, values['core'])
+        write(cursor, f'{table_prefix}game_average_boosts', self.BOOST_COLUMNS, values['boost'])
+        write(cursor, f'{table_prefix}game_average_movements', self.MOVEMENT_COLUMNS, values['movement'])
+        write(cursor, f'{table_prefix}game_average_positionings', self.POSITIONING_COLUMNS, values['positioning'])
+        write(cursor, f'{table_prefix}game_average_demos', self.DEMO_COLUMNS, values['demo'])
 
     def get_scores_by_days(self):
         """Dayごとのスコア取得
         """
+        return self.fetch_all(self.scores_by_days_sql())
+
+    @classmethod
+    def refresh_scores_all(cls, cursor):
+        """scores_all ビュー再計算
+
+        CONCURRENTLY で再計算するため、再計算中も /scores_all の読み取りはブロックされない。
 
-        sql = """
-            select
-                grp.name as group_name,
-                ply.name as player_name,
-                cml.wins,
-                cml_core.score,
-                cml_core.goals,
-                cml_core.shots,
-                cml_core.shooting_percentage,
-                cml_core.assists,
-                cml_core.saves,
-                grp.created as group_created
-            from
-                groups grp
-            inner join cumulatives cml on
-                grp.id = cml.group_id
-            inner join cumulative_cores cml_core on
-                cml.core_id = cml_core.id
-            inner join players ply on
-                cml.player_id = ply.id
-            where
-                grp.parent_group_id is not null
-            order by
-                grp.created, cml_core.score desc
+        Args:
+            cursor (obj): cursor
         """
-        with database.get_connection() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute(sql)
-                columns = [column[0] for column in cursor.description]
-                results = []
-                for row in cursor.fetchall():
-                    results.append(dict(zip(columns, row)))
-                return results
+        database.refresh_materialized_view(cursor, 'scores_all')
 
     def get_scores_all(self):
         """全試合スコア取得
         """
+        return self.fetch_all(self.scores_all_sql())
 
-        sql = """
-            select
-                tm.id as team_id,
-                tm.name as team_name,
-                ply.name as player_name,
-                cml.wins,
-                cml_core.score,
-                cml_core.goals,
-                cml_core.shots,
-                cml_core.shooting_percentage,
-                cml_core.assists,
-                cml_core.saves,
-                cml_demo.inflicted as demos,
-                (cml.wins / (select max(wins) from cumulatives) * 100) wins_parameter,
-                (cml_core.score / (select max(score) from cumulative_cores) * 100) score_parameter,
-                (cml_core.goals / (select max(goals) from cumulative_cores) * 100) goals_parameter,
-                (cml_core.shots / (select max(shots) from cumulative_cores) * 100) shots_parameter,
-                (cml_core.shooting_percentage / (select max(shooting_percentage) from cumulative_cores) * 100) shooting_percentage_parameter,
-                (cml_core.assists / (select max(assists) from cumulative_cores) * 100) assists_parameter,
-                (cml_core.saves / (select max(saves) from cumulative_cores) * 100) saves_parameter,
-                (cml_demo.inflicted / (select max(inflicted) from cumulative_demos) * 100) demos_parameter
-            from
-                groups grp
-            inner join cumulatives cml on
-                grp.id = cml.group_id
-            inner join cumulative_cores cml_core on
-                cml.core_id = cml_core.id
-            inner join cumulative_demos cml_demo on
-                cml.demo_id = cml_demo.id
-            inner join players ply on
-                cml.player_id = ply.id
-            inner join teams tm on
-                tm.bc_team_id = ply.team_id
-            where
-                grp.parent_group_id is null
-            order by
-                cml_core.score desc
+    def fetch_all(self, sql):
+        """SELECT 結果取得
+
+        Args:
+            sql (str): SQL
+
+        Returns:
+            List[dict]: 取得結果
         """
         with database.get_connection() as conn:
             with conn.cursor() as cursor:
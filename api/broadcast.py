@@ -0,0 +1,118 @@
+import asyncio
+import threading
+import traceback
+
+
+class Channel:
+    """Server-Sent Events の配信チャネル
+
+    データ更新の通知を受けると build() で最新の内容を 1 回だけ生成し、
+    シリアライズ済みのイベントを全クライアントのキューに配る。
+    クライアントごとのキューは最新の 1 件だけを保持するため、遅いクライアントは途中のイベントを読み飛ばす。
+    """
+
+    def __init__(self, event='update'):
+        self.event = event
+        self.subscribers = set()
+        self.latest = None
+        self.loop = None
+        self.dirty = None
+        self.lock = threading.Lock()
+        self.counters = {'published': 0, 'unchanged': 0, 'dropped': 0, 'errors': 0}
+
+    def subscribe(self):
+        """クライアント登録
+
+        Returns:
+            Queue: 配信イベントを受け取るキュー（最新のイベントがあれば格納済み）
+        """
+        queue = asyncio.Queue(maxsize=1)
+        if self.latest is not None:
+            queue.put_nowait(self.latest)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        """クライアント登録解除
+
+        Args:
+            queue (Queue): subscribe() で取得したキュー
+        """
+        self.subscribers.discard(queue)
+
+    def publish(self, data):
+        """全クライアントへ配信（イベントループ上で呼び出す）
+
+        Args:
+            data (bytes): シリアライズ済みの内容
+        """
+        message = self.format_event(data, self.event)
+        if message == self.latest:
+            # 内容が変わらない再生成（重複した更新通知など）は配信しない
+            self.counters['unchanged'] += 1
+            return
+        self.latest = message
+        for queue in list(self.subscribers):
+            if queue.full():
+                queue.get_nowait()
+                self.counters['dropped'] += 1
+            queue.put_nowait(message)
+        self.counters['published'] += 1
+
+    def notify(self):
+        """データ更新の通知
+
+        任意のスレッドから呼び出せる。連続した通知は 1 回の再生成にまとめる。
+        """
+        with self.lock:
+            loop, dirty = self.loop, self.dirty
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(dirty.set)
+
+    async def run(self, build):
+        """配信ループ
+
+        Args:
+            build (Callable): 配信する内容（bytes）を返すコルーチン関数
+        """
+        with self.lock:
+            self.loop = asyncio.get_event_loop()
+            self.dirty = asyncio.Event()
+        self.dirty.set()
+        try:
+            while True:
+                await self.dirty.wait()
+                self.dirty.clear()
+                try:
+                    data = await build()
+                except Exception:
+                    self.counters['errors'] += 1
+                    traceback.print_exc()
+                    continue
+                self.publish(data)
+        finally:
+            with self.lock:
+                self.loop = None
+                self.dirty = None
+
+    @staticmethod
+    def format_event(data, event=None):
+        """SSE のイベント形式に変換
+
+        Args:
+            data (bytes): 改行を含まない内容
+            event (str): イベント名
+
+        Returns:
+            bytes: イベント
+        """
+        prefix = f'event: {event}\n'.encode() if event else b''
+        return prefix + b'data: ' + data + b'\n\n'
+
+    def stats(self):
+        """チャネルの状態
+
+        Returns:
+            dict: 接続数、配信数など
+        """
+        return dict(self.counters, clients=len(self.subscribers))
@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from api import settings
+
+CACHE_MODES = ['off', 'on', 'replay']
+
+
+class CacheMissError(Exception):
+    """replay モードでキャッシュが存在しない"""
+
+
+class ResponseCache:
+    """外部 API レスポンスのディスクキャッシュ
+
+    本文は内容の SHA-256 をファイル名として objects/ 以下に保存し（content-addressed）、
+    リクエストと本文の対応・検証用ヘッダー・最終参照日時は SQLite の索引に保存する。
+
+    mode
+        off: キャッシュを使用しない
+        on: TTL 内はキャッシュを返し、TTL 経過後は ETag / Last-Modified で再検証する
+        replay: キャッシュのみを返す（ネットワークに接続しない）
+    """
+
+    HEADERS = ['Content-Type', 'Content-Range', 'ETag', 'Last-Modified']
+
+    def __init__(self, directory=None, mode=None, ttl=None, max_size=None):
+        self.directory = directory or settings.HTTP_CACHE_DIR
+        self.mode = mode or settings.HTTP_CACHE_MODE
+        self.ttl = settings.HTTP_CACHE_TTL if ttl is None else ttl
+        self.max_size = max_size or settings.HTTP_CACHE_MAX_SIZE
+        if self.mode not in CACHE_MODES:
+            raise ValueError(f'invalid cache mode: {self.mode}')
+
+        self.lock = threading.Lock()
+        self.index = None
+        if self.mode != 'off':
+            os.makedirs(os.path.join(self.directory, 'objects'), exist_ok=True)
+            self.index = sqlite3.connect(os.path.join(self.directory, 'index.sqlite3'), timeout=30, check_same_thread=False)
+            with self.index:
+                self.index.execute("""
+                    CREATE TABLE IF NOT EXISTS entries (
+                        key TEXT PRIMARY KEY,
+                        url TEXT NOT NULL,
+                        digest TEXT NOT NULL,
+                        status INTEGER NOT NULL,
+                        headers TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        stored_at REAL NOT NULL,
+                        accessed_at REAL NOT NULL
+                    )
+                """)
+
+    def request(self, url, params, headers, fetch):
+        """キャッシュを介したリクエスト
+
+        Args:
+            url (str): URL
+            params (dict): クエリパラメータ
+            headers (dict): レスポンスに影響するリクエストヘッダー（Range など）
+            fetch (callable): 追加ヘッダーを受け取ってリクエストを送信する関数
+
+        Returns:
+            Response: レスポンス
+        """
+        if self.mode == 'off':
+            return fetch({})
+
+        key = self.create_key(url, params, headers)
+        entry = self.get(key)
+        if self.mode == 'replay':
+            if entry is None:
+                raise CacheMissError(url)
+            return self.create_response(url, entry)
+        if entry is not None and time.time() - entry['stored_at'] < self.ttl:
+            return self.create_response(url, entry)
+
+        # 再検証
+        validators = {}
+        if entry is not None:
+            if 'ETag' in entry['headers']:
+                validators['If-None-Match'] = entry['headers']['ETag']
+            if 'Last-Modified' in entry['headers']:
+                validators['If-Modified-Since'] = entry['headers']['Last-Modified']
+
+        r = fetch(validators)
+        if r.status_code == 304 and entry is not None:
+            self.refresh(key)
+            return self.create_response(url, entry)
+        if r.status_code in (200, 206):
+            self.put(key, url, r)
+        return r
+
+    def create_key(self, url, params, headers):
+        """キャッシュキー生成
+
+        Args:
+            url (str): URL
+            params (dict): クエリパラメータ
+            headers (dict): レスポンスに影響するリクエストヘッダー
+
+        Returns:
+            str: キャッシュキー
+        """
+        data = json.dumps([url, sorted((params or {}).items()), sorted((headers or {}).items())], default=str)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def get(self, key):
+        """キャッシュ取得
+
+        Args:
+            key (str): キャッシュキー
+
+        Returns:
+            dict: キャッシュ（存在しなければ None）
+        """
+        with self.lock, self.index:
+            row = self.index.execute(
+                "SELECT digest, status, headers, stored_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.index.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (time.time(), key))
+
+        digest, status, headers, stored_at = row
+        try:
+            with open(self.object_path(digest), 'rb') as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+        return {
+            'content': content,
+            'status': status,
+            'headers': json.loads(headers),
+            'stored_at': stored_at,
+        }
+
+    def put(self, key, url, response):
+        """キャッシュ保存
+
+        Args:
+            key (str): キャッシュキー
+            url (str): URL
+            response (Response): レスポンス
+        """
+        content = response.content
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+
+        headers = {name: response.headers[name] for name in self.HEADERS if name in response.headers}
+        now = time.time()
+        with self.lock, self.index:
+            self.index.execute(
+                "INSERT OR REPLACE INTO entries (key, url, digest, status, headers, size, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, digest, response.status_code, json.dumps(headers), len(content), now, now)
+            )
+            self.evict()
+
+    def refresh(self, key):
+        """再検証済みキャッシュの保存日時更新
+
+        Args:
+            key (str): キャッシュキー
+        """
+        with self.lock, self.index:
+            self.index.execute("UPDATE entries SET stored_at = ? WHERE key = ?", (time.time(), key))
+
+    def evict(self):
+        """最終参照日時の古い順に max_size 以下になるまで削除"""
+        total = self.index.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_size:
+            return
+
+        rows = self.index.execute("SELECT key, digest, size FROM entries ORDER BY accessed_at").fetchall()
+        for key, digest, size in rows:
+            if total <= self.max_size:
+                break
+            self.index.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            shared = self.index.execute("SELECT 1 FROM entries WHERE digest = ? LIMIT 1", (digest,)).fetchone()
+            if shared is None:
+                try:
+                    os.remove(self.object_path(digest))
+                except FileNotFoundError:
+                    pass
+
+    def object_path(self, digest):
+        """本文の保存先パス
+
+        Args:
+            digest (str): 本文の SHA-256
+
+        Returns:
+            str: 保存先パス
+        """
+        return os.path.join(self.directory, 'objects', digest[:2], digest)
+
+    def create_response(self, url, entry):
+        """キャッシュから Response 生成
+
+        Args:
+            url (str): URL
+            entry (dict): キャッシュ
+
+        Returns:
+            Response: レスポンス
+        """
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response._content = entry['content']
+        response.url = url
+        return response
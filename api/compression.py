@@ -0,0 +1,112 @@
+import gzip
+
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+
+from api import settings
+
+# サーバー側の優先順
+ENCODINGS = ['br', 'gzip']
+
+
+def choose_encoding(accept_encoding):
+    """Accept-Encoding からレスポンスの圧縮形式を選ぶ
+
+    Args:
+        accept_encoding (str): Accept-Encoding ヘッダー
+
+    Returns:
+        str: 圧縮形式（圧縮しない場合は None）
+    """
+    if not accept_encoding:
+        return None
+    qualities = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[name.strip().lower()] = quality
+
+    candidates = [
+        encoding for encoding in ENCODINGS
+        if qualities.get(encoding, qualities.get('*', 0.0)) > 0
+    ]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda encoding: qualities.get(encoding, qualities.get('*', 0.0)))
+
+
+def compress(body, encoding):
+    """圧縮
+
+    Args:
+        body (bytes): 内容
+        encoding (str): 圧縮形式（br / gzip）
+
+    Returns:
+        bytes: 圧縮した内容
+    """
+    if encoding == 'br':
+        return brotli.compress(body, quality=settings.BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=settings.GZIP_COMPRESS_LEVEL)
+    raise ValueError(f'unsupported encoding: {encoding}')
+
+
+class CompressionMiddleware:
+    """JSON レスポンスの圧縮
+
+    Accept-Encoding で br / gzip を選んで圧縮する。
+    ストリーミング（SSE など）と圧縮済みのレスポンス、minimum_size 未満のレスポンスはそのまま返す。
+    """
+
+    def __init__(self, app, minimum_size=None):
+        self.app = app
+        self.minimum_size = settings.COMPRESSION_MINIMUM_SIZE if minimum_size is None else minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get('accept-encoding'))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message['type'] == 'http.response.start':
+                start_message = message
+                return
+
+            if start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            headers = MutableHeaders(raw=start['headers'])
+            body = message.get('body', b'')
+            compressible = (
+                not message.get('more_body', False)
+                and 'content-encoding' not in headers
+                and headers.get('content-type', '').startswith('application/json')
+                and len(body) >= self.minimum_size
+            )
+            if compressible:
+                body = compress(body, encoding)
+                headers['Content-Encoding'] = encoding
+                headers['Content-Length'] = str(len(body))
+                headers.add_vary_header('Accept-Encoding')
+                message = dict(message, body=body)
+            await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
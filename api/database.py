@@ -1,7 +1,494 @@
+import datetime
+import io
+import json
 import os
+import socket
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
 import psycopg2
+from psycopg2 import extensions, extras, pool, sql
+
+from api import settings
+
+STAGING_PREFIX = 'staging_'
+COPY_ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    '\t': '\\t',
+    '\n': '\\n',
+    '\r': '\\r',
+})
+
+# 成績テーブルのレイアウトごとの search_path（wide は旧テーブルと同じ名前のビューを優先する）
+SEARCH_PATHS = {
+    'normalized': None,
+    'wide': 'wide, public',
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """スレッドセーフなコネクションプール
+
+    max_size まで使用中の場合は timeout 秒まで返却を待つ。
+    health_check_interval 秒以上使われていない接続はチェックアウト時に
+    SELECT 1 で確認し、切断されていれば作り直す。
+    """
+
+    def __init__(self, dsn, min_size, max_size, timeout, health_check_interval):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.pid = os.getpid()
+        self.idle = deque()
+        self.size = 0
+        self.condition = threading.Condition()
+        self.counters = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'created': 0,
+            'discarded': 0,
+        }
+        for _ in range(min_size):
+            self.idle.append((self.connect(), time.monotonic()))
+            self.size += 1
+
+    def connect(self):
+        """接続作成
+
+        Returns:
+            connection: 接続
+        """
+        options = {}
+        search_path = get_search_path()
+        if search_path:
+            options['options'] = f'-c search_path={search_path.replace(" ", "")}'
+        conn = psycopg2.connect(
+            self.dsn, keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3, **options
+        )
+        with self.condition:
+            self.counters['created'] += 1
+        return conn
+
+    def getconn(self):
+        """接続のチェックアウト
+
+        Returns:
+            connection: 接続
+        """
+        deadline = time.monotonic() + self.timeout
+        with self.condition:
+            while True:
+                if self.idle:
+                    conn, last_used = self.idle.pop()
+                    break
+                if self.size < self.max_size:
+                    conn, last_used = None, None
+                    self.size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters['timeouts'] += 1
+                    raise pool.PoolError(f'connection pool exhausted ({self.max_size} connections in use)')
+                self.counters['waits'] += 1
+                self.condition.wait(remaining)
+
+        try:
+            if conn is not None and not self.is_healthy(conn, last_used):
+                self.close(conn)
+                conn = None
+            if conn is None:
+                conn = self.connect()
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+
+        with self.condition:
+            self.counters['checkouts'] += 1
+        return conn
+
+    def putconn(self, conn):
+        """接続の返却
+
+        Args:
+            conn (connection): 接続
+        """
+        if not conn.closed and conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                self.close(conn)
+
+        with self.condition:
+            if conn.closed:
+                self.size -= 1
+            else:
+                self.idle.append((conn, time.monotonic()))
+            self.condition.notify()
+
+    def is_healthy(self, conn, last_used):
+        """接続の健全性確認
+
+        Args:
+            conn (connection): 接続
+            last_used (float): 最終使用日時（time.monotonic）
+
+        Returns:
+            bool: 使用可能な場合は True
+        """
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def close(self, conn):
+        """接続の破棄
+
+        Args:
+            conn (connection): 接続
+        """
+        with self.condition:
+            self.counters['discarded'] += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
 
+    def closeall(self):
+        """待機中の接続をすべて閉じる"""
+        with self.condition:
+            while self.idle:
+                conn, _ = self.idle.pop()
+                conn.close()
+                self.size -= 1
 
+    def detach(self):
+        """fork 後の子プロセスで、親プロセスから引き継いだ待機中の接続を切り離す
+
+        子プロセスで接続を閉じると終了メッセージが親プロセスと共有するソケットに送られ、
+        親プロセスの接続も切断される。子プロセス側の記述子を /dev/null に置き換えてから閉じる。
+        子プロセスには他のスレッドがないため、ロックは取らない。
+        """
+        devnull = os.open(os.devnull, os.O_RDWR)
+        try:
+            while self.idle:
+                conn, _ = self.idle.pop()
+                self.size -= 1
+                if not conn.closed:
+                    os.dup2(devnull, conn.fileno())
+                    conn.close()
+        finally:
+            os.close(devnull)
+
+    def stats(self):
+        """統計情報
+
+        Returns:
+            dict: プールサイズ・使用中の接続数とカウンター
+        """
+        with self.condition:
+            return {
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size': self.size,
+                'idle': len(self.idle),
+                'in_use': self.size - len(self.idle),
+                **self.counters,
+            }
+
+
+def get_search_path():
+    """成績テーブルのレイアウトに応じた search_path
+
+    Returns:
+        str: search_path（既定のままでよい場合は None）
+    """
+    return SEARCH_PATHS[settings.STORAGE_LAYOUT]
+
+
+def get_pool():
+    """プロセス共通のコネクションプール取得
+
+    Returns:
+        ConnectionPool: コネクションプール
+    """
+    global _pool
+    with _pool_lock:
+        # fork 後の子プロセスでは親の接続を使わない（閉じずに切り離す）
+        if _pool is None or _pool.pid != os.getpid():
+            if _pool is not None:
+                _pool.detach()
+            _pool = ConnectionPool(
+                os.environ['DATABASE_URL'],
+                settings.DB_POOL_MIN_SIZE,
+                settings.DB_POOL_MAX_SIZE,
+                settings.DB_POOL_TIMEOUT,
+                settings.DB_POOL_HEALTH_CHECK_INTERVAL,
+            )
+        return _pool
+
+
+@contextmanager
 def get_connection():
-    dsn = os.environ['DATABASE_URL']
-    return psycopg2.connect(dsn)
+    """プールから接続を取得
+
+    with ブロックを正常に抜けるとコミット、例外時はロールバックして接続をプールに返す。
+    """
+    connection_pool = get_pool()
+    conn = connection_pool.getconn()
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        connection_pool.putconn(conn)
+
+
+def create_staging_tables(cursor, tables):
+    """ステージングテーブル作成
+
+    本テーブルと同じ定義の一時テーブルを作成する。一時テーブルはコミット時に削除される。
+
+    Args:
+        cursor (obj): cursor
+        tables (List[str]): 本テーブル名
+    """
+    for table in tables:
+        cursor.execute(f'CREATE TEMP TABLE {STAGING_PREFIX}{table} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP')
+
+
+def swap_staging_tables(cursor, tables):
+    """ステージングテーブルの内容で本テーブルを置き換え
+
+    TRUNCATE は ACCESS EXCLUSIVE ロックで参照クエリをブロックするため DELETE で入れ替える。
+    参照側にはコミットまで旧データ、コミット後は新データが見える。
+    外部キーがあるため、参照する側のテーブルから削除し、参照される側のテーブルから登録する。
+
+    Args:
+        cursor (obj): cursor
+        tables (List[str]): 本テーブル名（参照される側のテーブルが先）
+    """
+    for table in reversed(tables):
+        cursor.execute(f'DELETE FROM {table}')
+    for table in tables:
+        cursor.execute(f'INSERT INTO {table} SELECT * FROM {STAGING_PREFIX}{table}')
+
+
+def refresh_materialized_view(cursor, view, concurrently=True):
+    """マテリアライズドビュー再計算
+
+    Args:
+        cursor (obj): cursor
+        view (str): ビュー名
+        concurrently (bool): True の場合は読み取りをブロックせずに再計算する（ユニークインデックスが必要）
+    """
+    option = sql.SQL('CONCURRENTLY ') if concurrently else sql.SQL('')
+    cursor.execute(sql.SQL('REFRESH MATERIALIZED VIEW {}{}').format(option, sql.Identifier(view)))
+
+
+def notify_source():
+    """通知元のプロセスの識別子
+
+    fork したワーカーで同じ値にならないよう、呼び出し時のホスト名とプロセスIDから生成する。
+
+    Returns:
+        str: 識別子
+    """
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def notify(cursor, payload):
+    """データ更新の通知
+
+    settings.DB_NOTIFY_CHANNEL に NOTIFY する。通知はコミット時に配信され、ロールバックすると破棄される。
+
+    Args:
+        cursor (obj): cursor
+        payload (str): 更新内容（テーブル名など）
+    """
+    message = json.dumps({'source': notify_source(), 'payload': payload})
+    cursor.execute('SELECT pg_notify(%s, %s)', (settings.DB_NOTIFY_CHANNEL, message))
+
+
+def parse_notification(message):
+    """notify() の通知内容の解析
+
+    Args:
+        message (str): 通知内容
+
+    Returns:
+        Tuple[str, str]: 通知元の識別子、更新内容（解析できない場合は通知元 None）
+    """
+    try:
+        data = json.loads(message)
+        return data['source'], data['payload']
+    except (TypeError, ValueError, KeyError):
+        return None, message
+
+
+def bulk_insert(cursor, table, columns, rows, loader=None):
+    """BULK INSERT
+
+    Args:
+        cursor (obj): cursor
+        table (str): テーブル名
+        columns (List[str]): カラム名
+        rows (Iterable[tuple]): 登録データ
+        loader (str): 'copy' または 'values'（省略時は settings.BULK_LOADER）
+    """
+    loader = loader or settings.BULK_LOADER
+    if loader == 'copy':
+        copy_insert(cursor, table, columns, rows)
+    else:
+        values_insert(cursor, table, columns, rows)
+
+
+def bulk_upsert(cursor, table, columns, rows, keys=('id',), loader=None):
+    """BULK UPSERT
+
+    keys が重複する行は更新する。値に変化のない行は書き込まない。
+
+    Args:
+        cursor (obj): cursor
+        table (str): テーブル名
+        columns (List[str]): カラム名
+        rows (Iterable[tuple]): 登録データ
+        keys (List[str]): 一意キーのカラム名
+        loader (str): 'copy' または 'values'（省略時は settings.BULK_LOADER）
+    """
+    loader = loader or settings.BULK_LOADER
+    updates = [column for column in columns if column not in keys]
+    if updates:
+        assignments = ', '.join(f'{column} = EXCLUDED.{column}' for column in updates)
+        current = ', '.join(f'{table}.{column}' for column in updates)
+        excluded = ', '.join(f'EXCLUDED.{column}' for column in updates)
+        conflict = f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {assignments} WHERE ({current}) IS DISTINCT FROM ({excluded})"
+    else:
+        conflict = f"ON CONFLICT ({', '.join(keys)}) DO NOTHING"
+
+    if loader == 'copy':
+        # 一時テーブルに COPY してからまとめて UPSERT する
+        staging = f'upsert_{table}'
+        cursor.execute(f'CREATE TEMP TABLE {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP')
+        copy_insert(cursor, staging, columns, rows)
+        cursor.execute(f"INSERT INTO {table} ({', '.join(columns)}) SELECT {', '.join(columns)} FROM {staging} {conflict}")
+        cursor.execute(f'DROP TABLE {staging}')
+    else:
+        extras.execute_values(cursor, f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s {conflict}", rows)
+
+
+def values_insert(cursor, table, columns, rows):
+    """INSERT ... VALUES による BULK INSERT
+
+    Args:
+        cursor (obj): cursor
+        table (str): テーブル名
+        columns (List[str]): カラム名
+        rows (Iterable[tuple]): 登録データ
+    """
+    extras.execute_values(cursor, f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s", rows)
+
+
+def copy_insert(cursor, table, columns, rows):
+    """COPY FROM STDIN による BULK INSERT
+
+    Args:
+        cursor (obj): cursor
+        table (str): テーブル名
+        columns (List[str]): カラム名
+        rows (Iterable[tuple]): 登録データ
+    """
+    query = sql.SQL('COPY {} ({}) FROM STDIN').format(
+        sql.Identifier(table),
+        sql.SQL(', ').join(map(sql.Identifier, columns))
+    )
+    cursor.copy_expert(query.as_string(cursor), CopyStream(rows))
+
+
+def to_utc_timestamp(value):
+    """timestamp（タイムゾーンなし）列に登録する日時に変換
+
+    タイムゾーン付きの日時は、COPY では時差が捨てられ、INSERT ... VALUES ではセッションの
+    TimeZone に変換されるため、ローダーによって登録値が変わる。UTC のタイムゾーンなしの日時に揃える。
+
+    Args:
+        value (datetime): 日時
+
+    Returns:
+        datetime: UTC のタイムゾーンなしの日時
+    """
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def format_copy_value(value):
+    """COPY テキスト形式の値に変換
+
+    タイムゾーン付きの日時は時差付きで出力する（timestamptz 列向け）。
+    timestamp 列には to_utc_timestamp() で変換した値を渡すこと。
+
+    Args:
+        value (obj): 値
+
+    Returns:
+        str: COPY テキスト形式の値
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return str(value).translate(COPY_ESCAPES)
+
+
+class CopyStream(io.TextIOBase):
+    """COPY FROM STDIN 用の行ストリーム
+
+    登録データ全体を文字列化せず、read() で要求された分だけ行を変換して返す。
+    """
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = ''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        chunks = [self.buffer]
+        length = len(self.buffer)
+        while size is None or size < 0 or length < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            line = '\t'.join(format_copy_value(value) for value in row) + '\n'
+            chunks.append(line)
+            length += len(line)
+
+        data = ''.join(chunks)
+        if size is None or size < 0 or length <= size:
+            self.buffer = ''
+            return data
+        self.buffer = data[size:]
+        return data[:size]
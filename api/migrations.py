@@ -0,0 +1,812 @@
+import sys
+
+from api import database
+
+# 同時実行を防ぐアドバイザリロックのキー
+ADVISORY_LOCK_KEY = 720301
+
+SCHEMA_MIGRATIONS_DDL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version integer PRIMARY KEY,
+        name varchar NOT NULL,
+        applied_at timestamp NOT NULL DEFAULT now()
+    )
+"""
+
+SEQUENCES = [
+    'background_task_id_seq',
+    'cumulative_id_seq',
+    'cumulative_core_id_seq',
+    'cumulative_boost_id_seq',
+    'cumulative_movement_id_seq',
+    'cumulative_positioning_id_seq',
+    'cumulative_demo_id_seq',
+    'game_average_id_seq',
+    'game_average_core_id_seq',
+    'game_average_boost_id_seq',
+    'game_average_movement_id_seq',
+    'game_average_positioning_id_seq',
+    'game_average_demo_id_seq',
+]
+
+# 既存のデータベースにも適用できるように、作成済みのオブジェクトはそのままにする
+CREATE_SCHEMA = [f'CREATE SEQUENCE IF NOT EXISTS {name}' for name in SEQUENCES] + [
+    """
+        CREATE TABLE IF NOT EXISTS background_tasks (
+            id integer NOT NULL,
+            status text NOT NULL,
+            created_at timestamp NOT NULL
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS groups (
+            id varchar PRIMARY KEY,
+            name varchar NOT NULL,
+            parent_group_id varchar,
+            created timestamp
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS players (
+            id varchar PRIMARY KEY,
+            name varchar NOT NULL,
+            team_id varchar,
+            platform varchar
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS cumulatives (
+            id integer PRIMARY KEY,
+            group_id varchar NOT NULL,
+            player_id varchar NOT NULL,
+            games numeric,
+            wins numeric,
+            win_percentage numeric,
+            play_duration numeric,
+            core_id integer NOT NULL,
+            boost_id integer NOT NULL,
+            movement_id integer NOT NULL,
+            positioning_id integer NOT NULL,
+            demo_id integer NOT NULL
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS game_averages (
+            id integer PRIMARY KEY,
+            group_id varchar NOT NULL,
+            player_id varchar NOT NULL,
+            core_id integer NOT NULL,
+            boost_id integer NOT NULL,
+            movement_id integer NOT NULL,
+            positioning_id integer NOT NULL,
+            demo_id integer NOT NULL
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS cumulative_cores (
+            id integer PRIMARY KEY,
+            shots numeric,
+            shots_against numeric,
+            goals numeric,
+            goals_against numeric,
+            saves numeric,
+            assists numeric,
+            score numeric,
+            mvp numeric,
+            shooting_percentage numeric
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS cumulative_boosts (
+            id integer PRIMARY KEY,
+            bpm numeric,
+            bcpm numeric,
+            avg_amount numeric,
+            amount_collected numeric,
+            amount_stolen numeric,
+            amount_collected_big numeric,
+            amount_stolen_big numeric,
+            amount_collected_small numeric,
+            amount_stolen_small numeric,
+            count_collected_big numeric,
+            count_stolen_big numeric,
+            count_collected_small numeric,
+            count_stolen_small numeric,
+            time_zero_boost numeric,
+            percent_zero_boost numeric,
+            time_full_boost numeric,
+            percent_full_boost numeric,
+            amount_overfill numeric,
+            amount_overfill_stolen numeric,
+            amount_used_while_supersonic numeric,
+            time_boost_0_25 numeric,
+            time_boost_25_50 numeric,
+            time_boost_50_75 numeric,
+            time_boost_75_100 numeric,
+            percent_boost_0_25 numeric,
+            percent_boost_25_50 numeric,
+            percent_boost_50_75 numeric,
+            percent_boost_75_100 numeric
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS cumulative_movements (
+            id integer PRIMARY KEY,
+            avg_speed numeric,
+            total_distance numeric,
+            time_supersonic_speed numeric,
+            time_boost_speed numeric,
+            time_slow_speed numeric,
+            time_ground numeric,
+            time_low_air numeric,
+            time_high_air numeric,
+            time_powerslide numeric,
+            count_powerslide numeric,
+            avg_powerslide_duration numeric,
+            avg_speed_percentage numeric,
+            percent_slow_speed numeric,
+            percent_boost_speed numeric,
+            percent_supersonic_speed numeric,
+            percent_ground numeric,
+            percent_low_air numeric,
+            percent_high_air numeric
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS cumulative_positionings (
+            id integer PRIMARY KEY,
+            avg_distance_to_ball numeric,
+            avg_distance_to_ball_possession numeric,
+            avg_distance_to_ball_no_possession numeric,
+            time_defensive_third numeric,
+            time_neutral_third numeric,
+            time_offensive_third numeric,
+            time_defensive_half numeric,
+            time_offensive_half numeric,
+            time_behind_ball numeric,
+            time_infront_ball numeric,
+            time_most_back numeric,
+            time_most_forward numeric,
+            goals_against_while_last_defender numeric,
+            time_closest_to_ball numeric,
+            time_farthest_from_ball numeric,
+            percent_defensive_third numeric,
+            percent_offensive_third numeric,
+            percent_neutral_third numeric,
+            percent_defensive_half numeric,
+            percent_offensive_half numeric,
+            percent_behind_ball numeric,
+            percent_infront_ball numeric
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS cumulative_demos (
+            id integer PRIMARY KEY,
+            inflicted numeric,
+            taken numeric
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS game_average_cores (
+            id integer PRIMARY KEY,
+            shots numeric,
+            shots_against numeric,
+            goals numeric,
+            goals_against numeric,
+            saves numeric,
+            assists numeric,
+            score numeric,
+            mvp numeric,
+            shooting_percentage numeric
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS game_average_boosts (
+            id integer PRIMARY KEY,
+            bpm numeric,
+            bcpm numeric,
+            avg_amount numeric,
+            amount_collected numeric,
+            amount_stolen numeric,
+            amount_collected_big numeric,
+            amount_stolen_big numeric,
+            amount_collected_small numeric,
+            amount_stolen_small numeric,
+            count_collected_big numeric,
+            count_stolen_big numeric,
+            count_collected_small numeric,
+            count_stolen_small numeric,
+            time_zero_boost numeric,
+            percent_zero_boost numeric,
+            time_full_boost numeric,
+            percent_full_boost numeric,
+            amount_overfill numeric,
+            amount_overfill_stolen numeric,
+            amount_used_while_supersonic numeric,
+            time_boost_0_25 numeric,
+            time_boost_25_50 numeric,
+            time_boost_50_75 numeric,
+            time_boost_75_100 numeric,
+            percent_boost_0_25 numeric,
+            percent_boost_25_50 numeric,
+            percent_boost_50_75 numeric,
+            percent_boost_75_100 numeric
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS game_average_movements (
+            id integer PRIMARY KEY,
+            avg_speed numeric,
+            total_distance numeric,
+            time_supersonic_speed numeric,
+            time_boost_speed numeric,
+            time_slow_speed numeric,
+            time_ground numeric,
+            time_low_air numeric,
+            time_high_air numeric,
+            time_powerslide numeric,
+            count_powerslide numeric,
+            avg_powerslide_duration numeric,
+            avg_speed_percentage numeric,
+            percent_slow_speed numeric,
+            percent_boost_speed numeric,
+            percent_supersonic_speed numeric,
+            percent_ground numeric,
+            percent_low_air numeric,
+            percent_high_air numeric
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS game_average_positionings (
+            id integer PRIMARY KEY,
+            avg_distance_to_ball numeric,
+            avg_distance_to_ball_possession numeric,
+            avg_distance_to_ball_no_possession numeric,
+            time_defensive_third numeric,
+            time_neutral_third numeric,
+            time_offensive_third numeric,
+            time_defensive_half numeric,
+            time_offensive_half numeric,
+            time_behind_ball numeric,
+            time_infront_ball numeric,
+            time_most_back numeric,
+            time_most_forward numeric,
+            goals_against_while_last_defender numeric,
+            time_closest_to_ball numeric,
+            time_farthest_from_ball numeric,
+            percent_defensive_third numeric,
+            percent_offensive_third numeric,
+            percent_neutral_third numeric,
+            percent_defensive_half numeric,
+            percent_offensive_half numeric,
+            percent_behind_ball numeric,
+            percent_infront_ball numeric
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS game_average_demos (
+            id integer PRIMARY KEY,
+            inflicted numeric,
+            taken numeric
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS group_syncs (
+            group_id varchar PRIMARY KEY,
+            parent_group_id varchar NOT NULL,
+            fingerprint varchar NOT NULL,
+            synced_at timestamp NOT NULL
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS teams (
+            id varchar PRIMARY KEY,
+            name varchar NOT NULL,
+            bc_team_id varchar
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS cnv_teams (
+            toornament_id varchar PRIMARY KEY,
+            ballchasing_id varchar NOT NULL
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS matches (
+            id varchar PRIMARY KEY,
+            status varchar NOT NULL,
+            stage_id varchar NOT NULL,
+            group_id varchar NOT NULL,
+            round_id varchar,
+            number integer NOT NULL,
+            type varchar NOT NULL,
+            scheduled_datetime timestamptz,
+            public_note text,
+            private_note text,
+            played_at timestamptz,
+            report_closed boolean NOT NULL
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS match_opponents (
+            match_id varchar NOT NULL,
+            number integer NOT NULL,
+            position integer NOT NULL,
+            result varchar,
+            rank integer,
+            forfeit boolean,
+            score integer,
+            participant_id varchar,
+            PRIMARY KEY (match_id, number)
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS match_games (
+            match_id varchar NOT NULL,
+            number integer NOT NULL,
+            status varchar NOT NULL,
+            opponent_number integer NOT NULL,
+            position integer,
+            result varchar,
+            rank integer,
+            forfeit boolean,
+            score integer,
+            PRIMARY KEY (match_id, number, opponent_number)
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS streaming_match (
+            position integer PRIMARY KEY,
+            team_id varchar
+        )
+    """,
+    "INSERT INTO streaming_match (position) VALUES (1), (2) ON CONFLICT DO NOTHING",
+]
+
+# スコア取得の結合・絞り込み列のインデックス（INCLUDE で参照列を含めて Index Only Scan にする）
+CREATE_READ_PATH_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS groups_parent_group_id_idx ON groups (parent_group_id) INCLUDE (name, created)",
+    "CREATE INDEX IF NOT EXISTS players_team_id_idx ON players (team_id) INCLUDE (name)",
+    "CREATE INDEX IF NOT EXISTS teams_bc_team_id_idx ON teams (bc_team_id) INCLUDE (name)",
+    "CREATE INDEX IF NOT EXISTS cumulatives_group_id_idx ON cumulatives (group_id, player_id) INCLUDE (wins, core_id, demo_id)",
+    "CREATE INDEX IF NOT EXISTS cumulatives_core_id_idx ON cumulatives (core_id)",
+    "CREATE INDEX IF NOT EXISTS cumulatives_demo_id_idx ON cumulatives (demo_id)",
+    """
+        CREATE INDEX IF NOT EXISTS cumulative_cores_scores_idx ON cumulative_cores (id)
+            INCLUDE (score, goals, shots, shooting_percentage, assists, saves)
+    """,
+    "CREATE INDEX IF NOT EXISTS cumulative_demos_inflicted_idx ON cumulative_demos (id) INCLUDE (inflicted)",
+    "CREATE INDEX IF NOT EXISTS game_averages_group_id_idx ON game_averages (group_id, player_id)",
+    "CREATE INDEX IF NOT EXISTS match_opponents_participant_id_idx ON match_opponents (participant_id)",
+    "CREATE INDEX IF NOT EXISTS background_tasks_id_idx ON background_tasks (id, created_at)",
+]
+
+# 親グループの集計値と正規化パラメータ（最大値を 100 とした値）を事前計算したビュー
+CREATE_SCORES_ALL_VIEW = [
+    """
+        CREATE MATERIALIZED VIEW IF NOT EXISTS scores_all AS
+        with totals as (
+            select
+                cml.id as cumulative_id,
+                cml.player_id,
+                cml.wins,
+                cml_core.score,
+                cml_core.goals,
+                cml_core.shots,
+                cml_core.shooting_percentage,
+                cml_core.assists,
+                cml_core.saves,
+                cml_demo.inflicted as demos
+            from
+                groups grp
+            inner join cumulatives cml on
+                grp.id = cml.group_id
+            inner join cumulative_cores cml_core on
+                cml.core_id = cml_core.id
+            inner join cumulative_demos cml_demo on
+                cml.demo_id = cml_demo.id
+            where
+                grp.parent_group_id is null
+        ), maximums as (
+            select
+                nullif(max(wins), 0) as wins,
+                nullif(max(score), 0) as score,
+                nullif(max(goals), 0) as goals,
+                nullif(max(shots), 0) as shots,
+                nullif(max(shooting_percentage), 0) as shooting_percentage,
+                nullif(max(assists), 0) as assists,
+                nullif(max(saves), 0) as saves,
+                nullif(max(demos), 0) as demos
+            from
+                totals
+        )
+        select
+            tot.cumulative_id,
+            tm.id as team_id,
+            tm.name as team_name,
+            ply.name as player_name,
+            tot.wins,
+            tot.score,
+            tot.goals,
+            tot.shots,
+            tot.shooting_percentage,
+            tot.assists,
+            tot.saves,
+            tot.demos,
+            (tot.wins / mx.wins * 100) wins_parameter,
+            (tot.score / mx.score * 100) score_parameter,
+            (tot.goals / mx.goals * 100) goals_parameter,
+            (tot.shots / mx.shots * 100) shots_parameter,
+            (tot.shooting_percentage / mx.shooting_percentage * 100) shooting_percentage_parameter,
+            (tot.assists / mx.assists * 100) assists_parameter,
+            (tot.saves / mx.saves * 100) saves_parameter,
+            (tot.demos / mx.demos * 100) demos_parameter
+        from
+            totals tot
+        cross join maximums mx
+        inner join players ply on
+            tot.player_id = ply.id
+        inner join teams tm on
+            tm.bc_team_id = ply.team_id
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS scores_all_cumulative_id_idx ON scores_all (cumulative_id)",
+    "CREATE INDEX IF NOT EXISTS scores_all_score_idx ON scores_all (score DESC)"
+]
+
+# 横持ちレイアウト（STORAGE_LAYOUT=wide）の成績項目
+WIDE_CORE_COLUMNS = [
+    'shots',
+    'shots_against',
+    'goals',
+    'goals_against',
+    'saves',
+    'assists',
+    'score',
+    'mvp',
+    'shooting_percentage',
+]
+WIDE_BOOST_COLUMNS = [
+    'bpm',
+    'bcpm',
+    'avg_amount',
+    'amount_collected',
+    'amount_stolen',
+    'amount_collected_big',
+    'amount_stolen_big',
+    'amount_collected_small',
+    'amount_stolen_small',
+    'count_collected_big',
+    'count_stolen_big',
+    'count_collected_small',
+    'count_stolen_small',
+    'time_zero_boost',
+    'percent_zero_boost',
+    'time_full_boost',
+    'percent_full_boost',
+    'amount_overfill',
+    'amount_overfill_stolen',
+    'amount_used_while_supersonic',
+    'time_boost_0_25',
+    'time_boost_25_50',
+    'time_boost_50_75',
+    'time_boost_75_100',
+    'percent_boost_0_25',
+    'percent_boost_25_50',
+    'percent_boost_50_75',
+    'percent_boost_75_100',
+]
+WIDE_MOVEMENT_COLUMNS = [
+    'avg_speed',
+    'total_distance',
+    'time_supersonic_speed',
+    'time_boost_speed',
+    'time_slow_speed',
+    'time_ground',
+    'time_low_air',
+    'time_high_air',
+    'time_powerslide',
+    'count_powerslide',
+    'avg_powerslide_duration',
+    'avg_speed_percentage',
+    'percent_slow_speed',
+    'percent_boost_speed',
+    'percent_supersonic_speed',
+    'percent_ground',
+    'percent_low_air',
+    'percent_high_air',
+]
+WIDE_POSITIONING_COLUMNS = [
+    'avg_distance_to_ball',
+    'avg_distance_to_ball_possession',
+    'avg_distance_to_ball_no_possession',
+    'time_defensive_third',
+    'time_neutral_third',
+    'time_offensive_third',
+    'time_defensive_half',
+    'time_offensive_half',
+    'time_behind_ball',
+    'time_infront_ball',
+    'time_most_back',
+    'time_most_forward',
+    'goals_against_while_last_defender',
+    'time_closest_to_ball',
+    'time_farthest_from_ball',
+    'percent_defensive_third',
+    'percent_offensive_third',
+    'percent_neutral_third',
+    'percent_defensive_half',
+    'percent_offensive_half',
+    'percent_behind_ball',
+    'percent_infront_ball',
+]
+WIDE_DEMO_COLUMNS = [
+    'inflicted',
+    'taken',
+]
+WIDE_STAT_COLUMNS = (
+    WIDE_CORE_COLUMNS + WIDE_BOOST_COLUMNS + WIDE_MOVEMENT_COLUMNS + WIDE_POSITIONING_COLUMNS + WIDE_DEMO_COLUMNS
+)
+WIDE_SUB_TABLES = [
+    ('cores', WIDE_CORE_COLUMNS),
+    ('boosts', WIDE_BOOST_COLUMNS),
+    ('movements', WIDE_MOVEMENT_COLUMNS),
+    ('positionings', WIDE_POSITIONING_COLUMNS),
+    ('demos', WIDE_DEMO_COLUMNS),
+]
+
+# 累計・平均成績を (グループ, プレイヤー, 種別) ごとに 1 行で持つテーブルと、
+# 既存のクエリがそのまま使えるように旧テーブルと同じ名前・列のビューを wide スキーマに作成する
+CREATE_WIDE_LAYOUT = [
+    "CREATE SEQUENCE IF NOT EXISTS public.player_stat_id_seq",
+    f"""
+        CREATE TABLE IF NOT EXISTS public.player_stats (
+            id integer NOT NULL DEFAULT nextval('public.player_stat_id_seq'),
+            group_id varchar NOT NULL,
+            player_id varchar NOT NULL,
+            kind varchar NOT NULL,
+            games numeric,
+            wins numeric,
+            win_percentage numeric,
+            play_duration numeric,
+            {', '.join(f'{column} numeric' for column in WIDE_STAT_COLUMNS)},
+            PRIMARY KEY (group_id, player_id, kind)
+        )
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS player_stats_id_idx ON public.player_stats (id)",
+    "CREATE SCHEMA IF NOT EXISTS wide",
+    """
+        CREATE OR REPLACE VIEW wide.cumulatives AS
+        select
+            id, group_id, player_id, games, wins, win_percentage, play_duration,
+            id as core_id, id as boost_id, id as movement_id, id as positioning_id, id as demo_id
+        from public.player_stats
+        where kind = 'cumulative'
+    """,
+    """
+        CREATE OR REPLACE VIEW wide.game_averages AS
+        select
+            id, group_id, player_id,
+            id as core_id, id as boost_id, id as movement_id, id as positioning_id, id as demo_id
+        from public.player_stats
+        where kind = 'game_average'
+    """,
+] + [
+    f"""
+        CREATE OR REPLACE VIEW wide.{kind}_{table} AS
+        select id, {', '.join(columns)}
+        from public.player_stats
+        where kind = '{kind}'
+    """
+    for kind in ['cumulative', 'game_average']
+    for table, columns in WIDE_SUB_TABLES
+] + [
+    """
+        CREATE MATERIALIZED VIEW IF NOT EXISTS wide.scores_all AS
+        with totals as (
+            select
+                st.id as cumulative_id,
+                st.player_id,
+                st.wins,
+                st.score,
+                st.goals,
+                st.shots,
+                st.shooting_percentage,
+                st.assists,
+                st.saves,
+                st.inflicted as demos
+            from
+                public.groups grp
+            inner join public.player_stats st on
+                grp.id = st.group_id
+                and st.kind = 'cumulative'
+            where
+                grp.parent_group_id is null
+        ), maximums as (
+            select
+                nullif(max(wins), 0) as wins,
+                nullif(max(score), 0) as score,
+                nullif(max(goals), 0) as goals,
+                nullif(max(shots), 0) as shots,
+                nullif(max(shooting_percentage), 0) as shooting_percentage,
+                nullif(max(assists), 0) as assists,
+                nullif(max(saves), 0) as saves,
+                nullif(max(demos), 0) as demos
+            from
+                totals
+        )
+        select
+            tot.cumulative_id,
+            tm.id as team_id,
+            tm.name as team_name,
+            ply.name as player_name,
+            tot.wins,
+            tot.score,
+            tot.goals,
+            tot.shots,
+            tot.shooting_percentage,
+            tot.assists,
+            tot.saves,
+            tot.demos,
+            (tot.wins / mx.wins * 100) wins_parameter,
+            (tot.score / mx.score * 100) score_parameter,
+            (tot.goals / mx.goals * 100) goals_parameter,
+            (tot.shots / mx.shots * 100) shots_parameter,
+            (tot.shooting_percentage / mx.shooting_percentage * 100) shooting_percentage_parameter,
+            (tot.assists / mx.assists * 100) assists_parameter,
+            (tot.saves / mx.saves * 100) saves_parameter,
+            (tot.demos / mx.demos * 100) demos_parameter
+        from
+            totals tot
+        cross join maximums mx
+        inner join public.players ply on
+            tot.player_id = ply.id
+        inner join public.teams tm on
+            tm.bc_team_id = ply.team_id
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS scores_all_cumulative_id_idx ON wide.scores_all (cumulative_id)",
+    "CREATE INDEX IF NOT EXISTS scores_all_score_idx ON wide.scores_all (score DESC)",
+]
+
+# チーム単位のスコア取得（/teams/{team_id}/scores, /matchup/scores）用
+CREATE_SCORES_ALL_TEAM_INDEX = "CREATE INDEX IF NOT EXISTS scores_all_team_id_idx ON {schema}.scores_all (team_id, score DESC)"
+
+# マッチ内の各試合をマッチに紐付け、マッチの削除・再登録で古い試合が残らないようにする
+ADD_MATCH_GAMES_FOREIGN_KEY = [
+    "DELETE FROM public.match_games WHERE match_id NOT IN (SELECT id FROM public.matches)",
+    """
+        ALTER TABLE public.match_games ADD CONSTRAINT match_games_match_id_fkey
+            FOREIGN KEY (match_id) REFERENCES public.matches (id) ON DELETE CASCADE
+    """,
+]
+
+# 主キーと同じ列の索引（プランナーは主キーを使うため参照されず、登録時の負荷だけが増える）
+DROP_DUPLICATE_STATS_INDEXES = [
+    "DROP INDEX IF EXISTS {schema}.cumulative_cores_scores_idx",
+    "DROP INDEX IF EXISTS {schema}.cumulative_demos_inflicted_idx",
+]
+
+# (バージョン, 名前, SQL) 適用済みのマイグレーションは変更せず、変更は新しいバージョンとして追加する
+# STORAGE_LAYOUT=wide では search_path の先頭が wide スキーマになるため、バージョン 4 以降はスキーマ名を明示する
+MIGRATIONS = [
+    (1, 'create schema', CREATE_SCHEMA),
+    (2, 'create read path indexes', CREATE_READ_PATH_INDEXES),
+    (3, 'create scores_all view', CREATE_SCORES_ALL_VIEW),
+    (4, 'create wide storage layout', CREATE_WIDE_LAYOUT),
+    (5, 'create scores_all team index', [
+        CREATE_SCORES_ALL_TEAM_INDEX.format(schema='public'),
+        CREATE_SCORES_ALL_TEAM_INDEX.format(schema='wide'),
+    ]),
+    (6, 'add match_games foreign key', ADD_MATCH_GAMES_FOREIGN_KEY),
+    (7, 'drop duplicate stats indexes', [statement.format(schema='public') for statement in DROP_DUPLICATE_STATS_INDEXES]),
+]
+
+
+def has_schema_migrations(cursor):
+    """schema_migrations テーブルの有無
+
+    Args:
+        cursor (obj): cursor
+
+    Returns:
+        bool: search_path 上にある場合は True
+    """
+    cursor.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+    return cursor.fetchone()[0]
+
+
+def applied_versions(cursor):
+    """適用済みバージョン取得
+
+    Args:
+        cursor (obj): cursor
+
+    Returns:
+        List[int]: 適用済みのバージョン
+    """
+    if not has_schema_migrations(cursor):
+        return []
+    cursor.execute("SELECT version FROM schema_migrations ORDER BY version")
+    return [row[0] for row in cursor.fetchall()]
+
+
+def pending_migrations(cursor, target=None):
+    """未適用のマイグレーション取得
+
+    Args:
+        cursor (obj): cursor
+        target (int): 適用するバージョンの上限（None の場合は最新まで）
+
+    Returns:
+        list: 未適用の (バージョン, 名前, SQL)
+    """
+    applied = set(applied_versions(cursor))
+    return [
+        migration for migration in MIGRATIONS
+        if migration[0] not in applied and (target is None or migration[0] <= target)
+    ]
+
+
+def migrate(cursor, target=None):
+    """未適用のマイグレーションを順に適用
+
+    呼び出し元のトランザクション内で実行する。適用が必要な場合だけアドバイザリロックを取り、
+    複数プロセスからの同時適用を防ぐ（最新の場合はロックを取らない）。
+
+    Args:
+        cursor (obj): cursor
+        target (int): 適用するバージョンの上限（None の場合は最新まで）
+
+    Returns:
+        List[int]: 適用したバージョン
+    """
+    if not pending_migrations(cursor, target):
+        return []
+
+    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (ADVISORY_LOCK_KEY,))
+    if not has_schema_migrations(cursor):
+        cursor.execute(SCHEMA_MIGRATIONS_DDL)
+    versions = []
+    for version, name, statements in pending_migrations(cursor, target):
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+        versions.append(version)
+    return versions
+
+
+def migrate_database():
+    """未適用のマイグレーションを専用のトランザクションで適用してコミット
+
+    データ取り込みのトランザクションとは分け、アドバイザリロックや DDL のロックを
+    外部 API の取得中に保持しないようにする。取り込みに失敗してもスキーマの更新は残る。
+
+    Returns:
+        List[int]: 適用したバージョン
+    """
+    with database.get_connection() as conn:
+        with conn.cursor() as cursor:
+            return migrate(cursor)
+
+
+def main(argv):
+    """コマンドライン実行
+
+        python -m api.migrations          最新まで適用
+        python -m api.migrations status   適用状況を表示
+    """
+    command = argv[0] if argv else 'migrate'
+    with database.get_connection() as conn:
+        with conn.cursor() as cursor:
+            if command == 'status':
+                applied = set(applied_versions(cursor))
+                for version, name, _ in MIGRATIONS:
+                    print(f"{version:>4} {'applied' if version in applied else 'pending':<8} {name}")
+            elif command == 'migrate':
+                versions = migrate(cursor)
+                print(f"applied: {', '.join(map(str, versions))}" if versions else 'up to date')
+            else:
+                raise SystemExit(f'unknown command: {command}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
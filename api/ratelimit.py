@@ -0,0 +1,126 @@
+import datetime
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+
+class RateLimiter:
+    """トークンバケット方式のレート制限
+
+    送信レートと同時実行数を AIMD で調整する。
+    429 を受けると両方を半分に下げ（Retry-After があればその間は送信を止める）、
+    成功が続くと上限まで少しずつ戻す。
+    """
+
+    def __init__(self, rate, burst, max_concurrency):
+        self.max_rate = rate
+        self.min_rate = rate / 16
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.max_concurrency = max_concurrency
+        self.concurrency = max_concurrency
+        self.active = 0
+        self.successes = 0
+        self.blocked_until = 0
+        self.updated = time.monotonic()
+        self.condition = threading.Condition()
+        self.counters = {
+            'requests': 0,
+            'throttled': 0,
+            'retried': 0,
+        }
+
+    def acquire(self):
+        """送信枠の取得（取得できるまで待機）"""
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                self.refill(now)
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.tokens < 1:
+                    wait = (1 - self.tokens) / self.rate
+                elif self.active >= self.concurrency:
+                    wait = None
+                else:
+                    self.tokens -= 1
+                    self.active += 1
+                    self.counters['requests'] += 1
+                    return
+                self.condition.wait(wait)
+
+    def release(self, throttled=False, retry_after=None):
+        """送信枠の返却
+
+        Args:
+            throttled (bool): 429 を受けた場合は True
+            retry_after (float): Retry-After の秒数
+        """
+        with self.condition:
+            self.active -= 1
+            if throttled:
+                self.counters['throttled'] += 1
+                self.successes = 0
+                self.rate = max(self.rate / 2, self.min_rate)
+                self.concurrency = max(self.concurrency // 2, 1)
+                self.tokens = min(self.tokens, 0)
+                if retry_after:
+                    self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            else:
+                self.successes += 1
+                self.rate = min(self.rate + self.max_rate / 10, self.max_rate)
+                if self.successes >= self.concurrency:
+                    self.successes = 0
+                    self.concurrency = min(self.concurrency + 1, self.max_concurrency)
+            self.condition.notify_all()
+
+    def retried(self):
+        """再試行回数の記録"""
+        with self.condition:
+            self.counters['retried'] += 1
+
+    def refill(self, now):
+        """経過時間分のトークン補充
+
+        Args:
+            now (float): 現在時刻（time.monotonic）
+        """
+        self.tokens = min(self.tokens + (now - self.updated) * self.rate, self.burst)
+        self.updated = now
+
+    def stats(self):
+        """統計情報
+
+        Returns:
+            dict: カウンターと現在の送信レート・同時実行数
+        """
+        with self.condition:
+            return {
+                **self.counters,
+                'rate': self.rate,
+                'concurrency': self.concurrency,
+                'active': self.active,
+            }
+
+
+def parse_retry_after(value):
+    """Retry-After ヘッダーの解析
+
+    Args:
+        value (str): Retry-After（秒数または HTTP 日付）
+
+    Returns:
+        float: 待機秒数（解析できなければ None）
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0)
@@ -0,0 +1,166 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from api import settings
+
+# last_modified はデータセットの更新日時（UNIX 時間の整数秒。登録されなかった古いデータは None）
+# variants は圧縮形式ごとの圧縮済みレスポンス（最初に要求されたときに生成する）
+CachedResult = namedtuple('CachedResult', ['body', 'etag', 'last_modified', 'variants'])
+
+
+class ResultCache:
+    """API レスポンスのプロセス内キャッシュ
+
+    エンドポイントとパラメータをキーに、シリアライズ済みのレスポンスと ETag を保持する。
+    データ更新時に bump() でデータセットのバージョンを上げると、それ以前のエントリは無効になる。
+    """
+
+    def __init__(self, ttl=None, max_entries=None):
+        self.ttl = settings.RESULT_CACHE_TTL if ttl is None else ttl
+        self.max_entries = settings.RESULT_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.version = 0
+        self.modified_at = math.ceil(time.time())
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'stale_puts': 0}
+        self.listeners = []
+
+    @staticmethod
+    def create_key(endpoint, params=None):
+        """キャッシュキー生成
+
+        Args:
+            endpoint (str): エンドポイント
+            params (dict): パラメータ
+
+        Returns:
+            tuple: キャッシュキー
+        """
+        return (endpoint, tuple(sorted((params or {}).items())))
+
+    def get(self, endpoint, params=None):
+        """キャッシュ取得
+
+        Args:
+            endpoint (str): エンドポイント
+            params (dict): パラメータ
+
+        Returns:
+            CachedResult: シリアライズ済みのレスポンス（なければ None）
+        """
+        with self.lock:
+            result = self._find(self.create_key(endpoint, params))
+            self.counters['hits' if result is not None else 'misses'] += 1
+            return result
+
+    def peek(self, endpoint, params=None):
+        """キャッシュ取得（ヒット数・ミス数に数えない）
+
+        ミスした後に同じキーを確認し直す場合に使う。
+
+        Args:
+            endpoint (str): エンドポイント
+            params (dict): パラメータ
+
+        Returns:
+            CachedResult: シリアライズ済みのレスポンス（なければ None）
+        """
+        with self.lock:
+            return self._find(self.create_key(endpoint, params))
+
+    def _find(self, key):
+        """有効なエントリの検索（ロックを取得して呼び出す）
+
+        Args:
+            key (tuple): キャッシュキー
+
+        Returns:
+            CachedResult: シリアライズ済みのレスポンス（なければ None）
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        version, stored_at, result = entry
+        if version == self.version and (self.ttl <= 0 or time.monotonic() - stored_at < self.ttl):
+            self.entries.move_to_end(key)
+            return result
+        del self.entries[key]
+        return None
+
+    def current(self):
+        """現在のバージョンと更新日時（取得開始前に呼び出し、put() に渡す）
+
+        Returns:
+            Tuple[int, int]: バージョン、更新日時
+        """
+        with self.lock:
+            return self.version, self.modified_at
+
+    def put(self, endpoint, params, body, version, modified_at):
+        """キャッシュ登録
+
+        ETag はレスポンスの内容から生成するため、バージョンが上がっても内容が同じなら変わらない。
+        取得開始後にバージョンが上がっていた場合は古いデータのため登録せず、更新日時なしで返す。
+
+        Args:
+            endpoint (str): エンドポイント
+            params (dict): パラメータ
+            body (bytes): シリアライズ済みのレスポンス
+            version (int): 取得開始時のバージョン
+            modified_at (int): 取得開始時の更新日時
+
+        Returns:
+            CachedResult: シリアライズ済みのレスポンス
+        """
+        key = self.create_key(endpoint, params)
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        with self.lock:
+            if version != self.version:
+                self.counters['stale_puts'] += 1
+                return CachedResult(body, etag, None, {})
+            result = CachedResult(body, etag, modified_at, {})
+            self.entries[key] = (version, time.monotonic(), result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            return result
+
+    def add_listener(self, listener):
+        """バージョン更新時に呼び出す関数の登録
+
+        Args:
+            listener (Callable): 引数なしの関数（bump() を呼び出したスレッドで実行される）
+        """
+        self.listeners.append(listener)
+
+    def bump(self):
+        """データセットのバージョンを上げて全エントリを無効化
+
+        Returns:
+            int: 新しいバージョン
+        """
+        with self.lock:
+            self.version += 1
+            # Last-Modified は秒単位のため、同じ秒の更新でも前回より後の時刻にする
+            self.modified_at = max(math.ceil(time.time()), self.modified_at + 1)
+            self.entries.clear()
+            version = self.version
+        for listener in self.listeners:
+            listener()
+        return version
+
+    def stats(self):
+        """キャッシュの状態
+
+        Returns:
+            dict: バージョン、エントリ数、ヒット数など
+        """
+        with self.lock:
+            return dict(self.counters, version=self.version, entries=len(self.entries))
+
+
+# プロセス共通のキャッシュ
+result_cache = ResultCache()
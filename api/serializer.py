@@ -0,0 +1,42 @@
+import decimal
+
+import orjson
+from starlette.responses import JSONResponse
+
+
+def _default(obj):
+    """orjson が直接扱えない値の変換
+
+    Args:
+        obj (Any): 値
+
+    Returns:
+        Any: JSON に変換できる値
+    """
+    if isinstance(obj, decimal.Decimal):
+        # jsonable_encoder と同じく整数値は int、それ以外は float
+        return int(obj) if obj.as_tuple().exponent >= 0 else float(obj)
+    if hasattr(obj, 'dict'):
+        return obj.dict()
+    raise TypeError(f'Type is not JSON serializable: {type(obj).__name__}')
+
+
+def dumps(content):
+    """JSON シリアライズ
+
+    datetime / date は orjson が ISO 8601 形式で、Decimal は数値として出力する。
+
+    Args:
+        content (Any): 内容
+
+    Returns:
+        bytes: JSON（UTF-8）
+    """
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    """orjson でシリアライズする JSON レスポンス"""
+
+    def render(self, content):
+        return dumps(content)
@@ -0,0 +1,37 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from api import settings
+
+
+def create_session(pool_size=None, retries=None, backoff_factor=None):
+    """HTTP セッション生成
+
+    接続を keep-alive で再利用するコネクションプールを持つセッションを生成する。
+    接続エラーと 5xx レスポンスはバックオフしながら再試行する。
+    429 は呼び出し側のレート制限で扱うため再試行しない。
+
+    Args:
+        pool_size (int): ホストごとの最大接続数（省略時は settings.HTTP_POOL_SIZE）
+        retries (int): 最大再試行回数（省略時は settings.HTTP_RETRIES）
+        backoff_factor (float): 再試行間隔の係数（省略時は settings.HTTP_BACKOFF_FACTOR）
+
+    Returns:
+        Session: HTTP セッション
+    """
+    pool_size = pool_size or settings.HTTP_POOL_SIZE
+    retry = Retry(
+        total=settings.HTTP_RETRIES if retries is None else retries,
+        backoff_factor=settings.HTTP_BACKOFF_FACTOR if backoff_factor is None else backoff_factor,
+        status_forcelist=[500, 502, 503, 504],
+        allowed_methods=frozenset(['GET', 'POST']),
+        raise_on_status=False,
+        respect_retry_after_header=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 from os.path import join, dirname
 
@@ -11,9 +12,52 @@ load_dotenv(dotenv_path)
 API_KEY = os.environ['API_KEY']
 CLIENT_ID = os.environ['CLIENT_ID']
 CLIENT_SECRET = os.environ['CLIENT_SECRET']
+TOORNAMENT_MAX_WORKERS = int(os.environ.get('TOORNAMENT_MAX_WORKERS', 4))
+TOORNAMENT_TOKEN_MARGIN = int(os.environ.get('TOORNAMENT_TOKEN_MARGIN', 60))
 
 # ballchasing
 BCS_API_KEY = os.environ['BCS_API_KEY']
+BCS_MAX_WORKERS = int(os.environ.get('BCS_MAX_WORKERS', 8))
+BCS_RATE_LIMIT = float(os.environ.get('BCS_RATE_LIMIT', 2))
+BCS_RATE_BURST = float(os.environ.get('BCS_RATE_BURST', 2))
+BCS_MAX_RETRIES = int(os.environ.get('BCS_MAX_RETRIES', 5))
+
+# database
+BULK_LOADER = os.environ.get('BULK_LOADER', 'copy')
+STORAGE_LAYOUT = os.environ.get('STORAGE_LAYOUT', 'normalized')
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 1))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_HEALTH_CHECK_INTERVAL = float(os.environ.get('DB_POOL_HEALTH_CHECK_INTERVAL', 30))
+ASYNC_DB_POOL_MIN_SIZE = int(os.environ.get('ASYNC_DB_POOL_MIN_SIZE', 1))
+ASYNC_DB_POOL_MAX_SIZE = int(os.environ.get('ASYNC_DB_POOL_MAX_SIZE', 10))
+DB_NOTIFY_CHANNEL = os.environ.get('DB_NOTIFY_CHANNEL', 'fast_tourball')
+DB_LISTEN_RETRY_INTERVAL = float(os.environ.get('DB_LISTEN_RETRY_INTERVAL', 5))
+
+# http
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 10))
+HTTP_TIMEOUT = (
+    float(os.environ.get('HTTP_CONNECT_TIMEOUT', 5)),
+    float(os.environ.get('HTTP_READ_TIMEOUT', 30)),
+)
+HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES', 3))
+HTTP_BACKOFF_FACTOR = float(os.environ.get('HTTP_BACKOFF_FACTOR', 0.5))
+HTTP_CACHE_MODE = os.environ.get('HTTP_CACHE_MODE', 'on')
+HTTP_CACHE_DIR = os.environ.get('HTTP_CACHE_DIR', join(tempfile.gettempdir(), 'fast-tourball-cache'))
+HTTP_CACHE_TTL = float(os.environ.get('HTTP_CACHE_TTL', 0))
+HTTP_CACHE_MAX_SIZE = int(os.environ.get('HTTP_CACHE_MAX_SIZE', 100 * 1024 * 1024))
+
+# result cache
+RESULT_CACHE_TTL = float(os.environ.get('RESULT_CACHE_TTL', 0))
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 256))
+
+# response
+COMPRESSION_MINIMUM_SIZE = int(os.environ.get('COMPRESSION_MINIMUM_SIZE', 500))
+GZIP_COMPRESS_LEVEL = int(os.environ.get('GZIP_COMPRESS_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 5))
+
+# overlay
+OVERLAY_KEEPALIVE_INTERVAL = float(os.environ.get('OVERLAY_KEEPALIVE_INTERVAL', 15))
 
 REQUEST_METHOD = {
     'get': 'GET',
@@ -1,11 +1,14 @@
 import datetime
 import json
-import requests
+import threading
+import time
 import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-from psycopg2 import extras
-
-from api import settings, database
+from api import settings, database, migrations, session, cache
+from api.results import result_cache
+from api.ballchasing import Ballchasing
 from api.models.toornament import Tournament, Participant, Group, Stage, Match, MatchGame
 
 
@@ -19,12 +22,56 @@ class Toornament:
         'organizer:result',
     ]
 
+    TEAM_COLUMNS = [
+        'id',
+        'name',
+        'bc_team_id',
+    ]
+    MATCH_COLUMNS = [
+        'id',
+        'status',
+        'stage_id',
+        'group_id',
+        'round_id',
+        'number',
+        'type',
+        'scheduled_datetime',
+        'public_note',
+        'private_note',
+        'played_at',
+        'report_closed',
+    ]
+    MATCH_OPPONENT_COLUMNS = [
+        'match_id',
+        'number',
+        'position',
+        'result',
+        'rank',
+        'forfeit',
+        'score',
+        'participant_id',
+    ]
+    MATCH_GAME_COLUMNS = [
+        'match_id',
+        'number',
+        'status',
+        'opponent_number',
+        'position',
+        'result',
+        'rank',
+        'forfeit',
+        'score',
+    ]
+
     access_token = None
+    token_expires_at = 0
     db = None
 
     def __init__(self, *args, **kwargs):
         self.db = kwargs.get('db')
-        self.auth()
+        self.session = session.create_session()
+        self.cache = cache.ResponseCache()
+        self.token_lock = threading.Lock()
 
     def auth(self):
         """アクセス認証
@@ -37,13 +84,44 @@ class Toornament:
             'client_secret': settings.CLIENT_SECRET,
             'scope': ' '.join(self.SCOPE),
         }
-        r = requests.post(url, data=data)
+        r = self.session.post(url, data=data, timeout=settings.HTTP_TIMEOUT)
+        r.raise_for_status()
         data = r.json()
         self.access_token = data['access_token']
+        expires_in = data.get('expires_in')
+        if expires_in is None:
+            self.token_expires_at = float('inf')
+        else:
+            # 有効期間が短いトークンでも取得直後に期限切れ扱いにならないよう、余裕は有効期間の半分までにする
+            margin = min(settings.TOORNAMENT_TOKEN_MARGIN, expires_in / 2)
+            self.token_expires_at = time.monotonic() + expires_in - margin
+
+    def get_access_token(self, expired_token=None):
+        """アクセストークン取得
+
+        初回呼び出し時に認証し、有効期限の settings.TOORNAMENT_TOKEN_MARGIN 秒前（有効期間の半分が上限）までは
+        取得済みのトークンを返す。同時に呼ばれた場合も認証リクエストは 1 回にまとめる。
+
+        Args:
+            expired_token (str): 401 を受けたトークン（他のスレッドで更新済みなら再認証しない）
+
+        Returns:
+            str: アクセストークン
+        """
+        with self.token_lock:
+            if (
+                self.access_token is None
+                or self.access_token == expired_token
+                or time.monotonic() >= self.token_expires_at
+            ):
+                self.auth()
+            return self.access_token
 
     def send_request(self, url, headers={}, method=settings.REQUEST_METHOD['get']):
         """リクエスト送信
 
+        401 を受けた場合はトークンを更新して 1 回だけ再送信する。
+
         Args:
             url (str): URL
             headers (dict): Header情報
@@ -54,29 +132,31 @@ class Toornament:
         """
 
         request_url = self.BASE_URL + url
-        base_headers = {
-            'Authorization': f'Bearer {self.access_token}',
-            'X-Api-Key': settings.API_KEY
-        }
-        req_headers = {**base_headers, **headers}
+
+        def send(access_token, validators):
+            base_headers = {
+                'Authorization': f'Bearer {access_token}',
+                'X-Api-Key': settings.API_KEY
+            }
+            req_headers = {**base_headers, **headers, **validators}
+            return self.session.get(request_url, headers=req_headers, timeout=settings.HTTP_TIMEOUT)
 
         if method == settings.REQUEST_METHOD['get']:
-            return requests.get(request_url, headers=req_headers)
+            def fetch(validators):
+                access_token = self.get_access_token()
+                r = send(access_token, validators)
+                if r.status_code == 401:
+                    r = send(self.get_access_token(expired_token=access_token), validators)
+                return r
+            return self.cache.request(request_url, None, headers, fetch)
 
     def get_tournaments(self):
         """トーナメントデータ取得
 
         Returns:
-            List[Response]: トーナメントデータ
+            List[Tournament]: トーナメントデータ
         """
-
-        url = '/tournaments'
-        headers = {
-            'Range': 'tournaments=0-49'
-        }
-        r = self.send_request(url, headers, settings.REQUEST_METHOD['get'])
-        tournaments = [Tournament(**x) for x in r.json()]
-        return tournaments
+        return list(self.iter_range('/tournaments', 'tournaments', 50, Tournament))
 
     def get_participants(self, tournament_id):
         """参加者データ取得
@@ -87,14 +167,19 @@ class Toornament:
         Returns:
             List[Participant]: 参加者データ
         """
+        return list(self.iter_participants(tournament_id))
 
+    def iter_participants(self, tournament_id):
+        """参加者データ取得（ストリーム）
+
+        Args:
+            tournament_id (int): トーナメントID
+
+        Returns:
+            Iterator[Participant]: 参加者データ
+        """
         url = f'/tournaments/{tournament_id}/participants'
-        headers = {
-            'Range': 'participants=0-49'
-        }
-        r = self.send_request(url, headers, settings.REQUEST_METHOD['get'])
-        participants = [Participant(**x) for x in r.json()]
-        return participants
+        return self.iter_range(url, 'participants', 50, Participant)
 
     def get_groups(self, tournament_id):
         """グループデータ取得
@@ -105,14 +190,19 @@ class Toornament:
         Returns:
             List[Group]: グループデータ
         """
+        return list(self.iter_groups(tournament_id))
+
+    def iter_groups(self, tournament_id):
+        """グループデータ取得（ストリーム）
+
+        Args:
+            tournament_id (int): トーナメントID
 
+        Returns:
+            Iterator[Group]: グループデータ
+        """
         url = f'/tournaments/{tournament_id}/groups'
-        headers = {
-            'Range': 'groups=0-49'
-        }
-        r = self.send_request(url, headers, settings.REQUEST_METHOD['get'])
-        groups = [Group(**x) for x in r.json()]
-        return groups
+        return self.iter_range(url, 'groups', 50, Group)
 
     def get_stages(self, tournament_id):
         """ステージデータ取得
@@ -138,15 +228,19 @@ class Toornament:
         Returns:
             List[Match]: マッチデータ
         """
+        return list(self.iter_matches(tournament_id))
+
+    def iter_matches(self, tournament_id):
+        """マッチデータ取得（ストリーム）
+
+        Args:
+            tournament_id (int): トーナメントID
 
+        Returns:
+            Iterator[Match]: マッチデータ
+        """
         url = f'/tournaments/{tournament_id}/matches'
-        headers = {
-            'Range': 'matches=0-99'
-        }
-        r = self.send_request(url, headers=headers)
-        ret = r.json()
-        matches = [Match(**x) for x in r.json()]
-        return matches
+        return self.iter_range(url, 'matches', 100, Match)
 
     def get_match_games(self, tournament_id, match_id):
         """マッチ内の各試合データ取得
@@ -158,15 +252,100 @@ class Toornament:
         Returns:
             List[MatchGame]: マッチ内の各試合データ
         """
+        return list(self.iter_match_games(tournament_id, match_id))
+
+    def iter_match_games(self, tournament_id, match_id):
+        """マッチ内の各試合データ取得（ストリーム）
+
+        Args:
+            tournament_id (int): トーナメントID
+            match_id (int): マッチID
 
+        Returns:
+            Iterator[MatchGame]: マッチ内の各試合データ
+        """
         url = f'/tournaments/{tournament_id}/matches/{match_id}/games'
-        headers = {
-            'Range': 'games=0-49'
-        }
-        r = self.send_request(url, headers=headers)
-        ret = r.json()
-        match_games = [MatchGame(**x) for x in r.json()]
-        return match_games
+        return self.iter_range(url, 'games', 50, MatchGame)
+
+    def get_match_games_all(self, tournament_id, match_ids, max_workers=None):
+        """複数マッチの各試合データ取得
+
+        max_workers 件まで並列に取得する。戻り値の順序は match_ids のまま。
+
+        Args:
+            tournament_id (int): トーナメントID
+            match_ids (List[str]): マッチID
+            max_workers (int): 同時リクエスト数（省略時は settings.TOORNAMENT_MAX_WORKERS）
+
+        Returns:
+            List[List[MatchGame]]: マッチごとの各試合データ
+        """
+        if not match_ids:
+            return []
+
+        max_workers = max_workers or settings.TOORNAMENT_MAX_WORKERS
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(match_ids))) as executor:
+            return list(executor.map(lambda match_id: self.get_match_games(tournament_id, match_id), match_ids))
+
+    def iter_range(self, url, unit, page_size, model, max_workers=None):
+        """Range ヘッダーによるページ分割取得
+
+        1 ページ目の Content-Range で総件数を確認し、残りのページを並列に取得する。
+        ページ順にモデルへ変換して返し、先読みするページは max_workers 件までに抑える。
+
+        Args:
+            url (str): URL
+            unit (str): Range の単位（participants など）
+            page_size (int): 1 ページの件数
+            model (type): 変換先のモデル
+            max_workers (int): 同時リクエスト数（省略時は settings.TOORNAMENT_MAX_WORKERS）
+
+        Returns:
+            Iterator[BaseModel]: 取得データ
+        """
+        def fetch(start):
+            headers = {
+                'Range': f'{unit}={start}-{start + page_size - 1}'
+            }
+            r = self.send_request(url, headers=headers)
+            # 範囲外（0 件）の場合は 416
+            return [] if r.status_code == 416 else r.json()
+
+        r = self.send_request(url, headers={'Range': f'{unit}=0-{page_size - 1}'})
+        if r.status_code == 416:
+            return
+        for x in r.json():
+            yield model(**x)
+
+        total = self.parse_content_range_total(r.headers.get('Content-Range'))
+        if total is None or total <= page_size:
+            return
+
+        max_workers = max_workers or settings.TOORNAMENT_MAX_WORKERS
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pages = deque()
+            for start in range(page_size, total, page_size):
+                pages.append(executor.submit(fetch, start))
+                if len(pages) >= max_workers:
+                    for x in pages.popleft().result():
+                        yield model(**x)
+            while pages:
+                for x in pages.popleft().result():
+                    yield model(**x)
+
+    def parse_content_range_total(self, content_range):
+        """Content-Range から総件数取得
+
+        Args:
+            content_range (str): Content-Range（例: participants 0-49/120）
+
+        Returns:
+            int: 総件数（不明な場合は None）
+        """
+        if not content_range:
+            return None
+        total = content_range.rsplit('/', 1)[-1]
+        return int(total) if total.isdigit() else None
 
     def init_db(self, tournament_id, background_task_id):
         """DB初期化
@@ -175,6 +354,7 @@ class Toornament:
             tournament_id (int): トーナメントID
         """
 
+        migrations.migrate_database()
         with database.get_connection() as conn:
             with conn.cursor() as cursor:
                 # Background Task Status
@@ -182,50 +362,97 @@ class Toornament:
                 cursor.execute("INSERT INTO background_tasks (id, status, created_at) VALUES (%s, %s, %s)", values)
 
         st = None
+        unmapped = []
         with database.get_connection() as conn:
             with conn.cursor() as cursor:
                 try:
                     tables = [
                         'teams',
                         'matches',
-                        'match_opponents'
+                        'match_opponents',
+                        'match_games'
                     ]
-                    for table in tables:
-                        cursor.execute(f'TRUNCATE TABLE {table}')
 
-                    # チーム情報書き換え
+                    # トーナメント情報取得
                     participants = self.get_participants(tournament_id)
-                    for participant in participants:
-                        id = participant.id
-                        name = participant.name
-                        cursor.execute("SELECT ballchasing_id FROM cnv_teams WHERE toornament_id = %s", [id])
-                        bc_team_id = cursor.fetchone()[0]
-                        cursor.execute("INSERT INTO teams (id, name, bc_team_id) VALUES (%s, %s, %s)", (id, name, bc_team_id))
-
-                    # マッチ情報書き換え
                     match_values = {
                         'base': [],
-                        'opponent': []
+                        'opponent': [],
+                        'game': []
                     }
-                    matches = self.get_matches(tournament_id)
-                    for match in matches:
+                    for match in self.iter_matches(tournament_id):
                         self.init_db_match(cursor, match, match_values)
                         for op in match.opponents:
                             self.init_db_match_opponent(cursor, match, op, match_values)
 
-                    # Bulk Insert
-                    self.bulk_insert_match(cursor, match_values)
+                    match_ids = [values[0] for values in match_values['base']]
+                    for match_id, match_games in zip(match_ids, self.get_match_games_all(tournament_id, match_ids)):
+                        for match_game in match_games:
+                            self.init_db_match_game(cursor, match_id, match_game, match_values)
+
+                    # ステージングテーブルに登録してから本テーブルと入れ替える
+                    prefix = database.STAGING_PREFIX
+                    database.create_staging_tables(cursor, tables)
+
+                    # チーム情報書き換え
+                    team_values, unmapped = self.create_team_values(cursor, participants)
+                    database.bulk_insert(cursor, f'{prefix}teams', self.TEAM_COLUMNS, team_values)
+
+                    # マッチ情報書き換え
+                    self.bulk_insert_match(cursor, match_values, table_prefix=prefix)
+
+                    # 本テーブルと入れ替え
+                    database.swap_staging_tables(cursor, tables)
+
+                    # チーム対応が変わるためスコア集計を再計算
+                    Ballchasing.refresh_scores_all(cursor)
+                    database.notify(cursor, 'teams')
 
                 except:
                     st = traceback.format_exc()
 
+        # コミットしたデータを返すようにレスポンスキャッシュを無効化
+        if st is None:
+            result_cache.bump()
+
         with database.get_connection() as conn:
             with conn.cursor() as cursor:
                 # Background Task Status
+                if st is None and unmapped:
+                    names = ', '.join(f'{p.name} ({p.id})' for p in unmapped)
+                    status = f'toornament init_db warning: cnv_teams に未登録の参加者: {names}'
+                    values = (background_task_id, status, datetime.datetime.now())
+                    cursor.execute("INSERT INTO background_tasks (id, status, created_at) VALUES (%s, %s, %s)", values)
+
                 status = 'toornament init_db ended' if st is None else f'toornament init_db error: {st}'
                 values = (background_task_id, status, datetime.datetime.now())
                 cursor.execute("INSERT INTO background_tasks (id, status, created_at) VALUES (%s, %s, %s)", values)
 
+    def create_team_values(self, cursor, participants):
+        """チーム情報の登録データ生成
+
+        cnv_teams を 1 回で読み込み、参加者ごとの ballchasing チームIDを解決する。
+        対応が未登録の参加者は bc_team_id を NULL として登録する。
+
+        Args:
+            cursor (obj): cursor
+            participants (List[Participant]): 参加者データ
+
+        Returns:
+            tuple: 登録データ, cnv_teams に未登録の参加者
+        """
+        cursor.execute("SELECT toornament_id, ballchasing_id FROM cnv_teams")
+        bc_team_ids = {str(toornament_id): ballchasing_id for toornament_id, ballchasing_id in cursor.fetchall()}
+
+        values = []
+        unmapped = []
+        for participant in participants:
+            bc_team_id = bc_team_ids.get(str(participant.id))
+            if bc_team_id is None:
+                unmapped.append(participant)
+            values.append((participant.id, participant.name, bc_team_id))
+        return values, unmapped
+
     def init_db_match(self, cursor, match, match_values):
         """マッチ情報初期化
 
@@ -273,14 +500,38 @@ class Toornament:
 
         match_values['opponent'].append(values)
 
-    def bulk_insert_match(self, cursor, values):
+    def init_db_match_game(self, cursor, match_id, match_game, match_values):
+        """マッチ内の各試合情報初期化
+
+        Args:
+            cursor (obj): cursor
+            match_id (str): マッチID
+            match_game (MatchGame): 試合情報
+            match_values (array): 登録データ
+        """
+        for op in match_game.opponents:
+            values = (
+                match_id,
+                match_game.number,
+                match_game.status,
+                op.number,
+                op.position,
+                op.result,
+                op.rank,
+                op.forfeit,
+                op.score
+            )
+
+            match_values['game'].append(values)
+
+    def bulk_insert_match(self, cursor, values, table_prefix=''):
         """マッチ情報 BULK INSERT
 
         Args:
-            cursor ([type]): [description]
-            values ([type]): [description]
+            cursor (obj): cursor
+            values (dict): 登録データ
+            table_prefix (str): 登録先テーブル名の接頭辞
         """
-        extras.execute_values(
-            cursor, "INSERT INTO matches (id, status, stage_id, group_id, round_id, number, type, scheduled_datetime, public_note, private_note, played_at, report_closed) VALUES %s", values['base'])
-        extras.execute_values(
-            cursor, "INSERT INTO match_opponents (match_id, number, position, result, rank, forfeit, score, participant_id) VALUES %s", values['opponent'])
+        database.bulk_insert(cursor, f'{table_prefix}matches', self.MATCH_COLUMNS, values['base'])
+        database.bulk_insert(cursor, f'{table_prefix}match_opponents', self.MATCH_OPPONENT_COLUMNS, values['opponent'])
+        database.bulk_insert(cursor, f'{table_prefix}match_games', self.MATCH_GAME_COLUMNS, values['game'])
@@ -0,0 +1,9 @@
+"""ベンチマーク共通の環境変数
+
+api.settings は読み込み時に必須の環境変数を参照するため、各スクリプトで api より先に import する。
+外部 API には接続しないので、未設定の認証情報はダミー値にする。
+"""
+import os
+
+for key in ['API_KEY', 'CLIENT_ID', 'CLIENT_SECRET', 'BCS_API_KEY']:
+    os.environ.setdefault(key, 'benchmark')
@@ -0,0 +1,55 @@
+"""BULK INSERT ローダーのベンチマーク
+
+execute_values（values）と COPY FROM STDIN（copy）で同じ行を一時テーブルに
+登録し、rows/sec と Python 側のピークメモリを比較する。DATABASE_URL が必要。
+
+    python -m benchmarks.bulk_loader
+"""
+import random
+import time
+import tracemalloc
+
+from benchmarks import _env  # noqa: F401
+from api import database, Ballchasing
+
+ROWS = [1000, 10000, 50000]
+LOADERS = ['values', 'copy']
+
+
+def create_rows(count):
+    width = len(Ballchasing.BOOST_COLUMNS) - 1
+    return [(i, *(random.random() * 1000 for _ in range(width))) for i in range(count)]
+
+
+def measure(cursor, loader, rows):
+    columns = Ballchasing.BOOST_COLUMNS
+    definition = ', '.join(f'{c} double precision' for c in columns[1:])
+    cursor.execute('DROP TABLE IF EXISTS bench_boosts')
+    cursor.execute(f'CREATE TEMP TABLE bench_boosts (id bigint, {definition})')
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    database.bulk_insert(cursor, 'bench_boosts', columns, rows, loader=loader)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    cursor.execute('SELECT count(*) FROM bench_boosts')
+    assert cursor.fetchone()[0] == len(rows)
+    return elapsed, peak
+
+
+def main():
+    print(f'{"rows":>6} {"loader":>7} {"rows/sec":>10} {"peak (KiB)":>11}')
+    with database.get_connection() as conn:
+        with conn.cursor() as cursor:
+            for count in ROWS:
+                rows = create_rows(count)
+                for loader in LOADERS:
+                    elapsed, peak = measure(cursor, loader, rows)
+                    print(f'{count:>6} {loader:>7} {count / elapsed:>10.0f} {peak / 1024:>11.0f}')
+            conn.rollback()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Ballchasing.get_group_children のベンチマーク
+
+ローカルのスタブサーバー（1リクエストごとに LATENCY 秒待機）に対して、
+子グループ数を増やしながら逐次取得と並列取得の所要時間を比較する。
+
+    python -m benchmarks.group_children
+"""
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from benchmarks import _env  # noqa: F401
+# スタブサーバーが相手なのでレート制限で並列取得が律速されないようにする
+os.environ.setdefault('BCS_RATE_LIMIT', '1000')
+os.environ.setdefault('BCS_RATE_BURST', '1000')
+
+from api import Ballchasing  # noqa: E402
+
+LATENCY = 0.05
+CHILDREN = [5, 10, 20, 40]
+
+
+def replay_group(group_id):
+    return {
+        'id': group_id,
+        'link': f'https://ballchasing.com/api/groups/{group_id}',
+        'name': group_id,
+        'created': '2021-05-01T00:00:00Z',
+        'status': 'ok',
+        'player_identification': 'by-id',
+        'team_identification': 'by-player-clusters',
+        'shared': True,
+        'creator': {
+            'steam_id': 0,
+            'name': 'benchmark',
+            'profile_url': '',
+            'avatar': '',
+            'avatar_full': '',
+            'avatar_medium': '',
+        },
+        'players': [],
+        'teams': [],
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        time.sleep(LATENCY)
+        url = urlparse(self.path)
+        if url.path == '/groups':
+            count = int(parse_qs(url.query)['group'][0])
+            body = {'list': [{'id': f'child-{i:03d}'} for i in range(count)]}
+        else:
+            body = replay_group(url.path.rsplit('/', 1)[-1])
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def measure(client, children, max_workers):
+    start = time.perf_counter()
+    groups = client.get_group_children(children, max_workers=max_workers)
+    elapsed = time.perf_counter() - start
+    assert [g.id for g in groups] == [f'child-{i:03d}' for i in range(children)]
+    return elapsed
+
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    client = Ballchasing()
+    client.BASE_URL = f'http://127.0.0.1:{server.server_port}'
+
+    print(f'latency per request: {LATENCY * 1000:.0f} ms')
+    print(f'{"children":>8} {"serial (s)":>11} {"concurrent (s)":>15} {"speedup":>8}')
+    for children in CHILDREN:
+        serial = measure(client, children, 1)
+        concurrent = measure(client, children, None)
+        print(f'{children:>8} {serial:>11.3f} {concurrent:>15.3f} {serial / concurrent:>7.1f}x')
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
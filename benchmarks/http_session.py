@@ -0,0 +1,87 @@
+"""HTTP コネクションプールのベンチマーク
+
+ローカルの HTTPS スタブサーバーに対して、リクエストごとに接続する requests.get と
+create_session() の keep-alive 接続で 1 リクエストあたりのレイテンシを比較する。
+自己署名証明書の生成に openssl コマンドを使用する。
+
+    python -m benchmarks.http_session
+"""
+import os
+import ssl
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+import urllib3
+
+from benchmarks import _env  # noqa: F401
+from api import session
+
+REQUESTS = 200
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        data = b'{"list": []}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(directory):
+    cert = os.path.join(directory, 'cert.pem')
+    key = os.path.join(directory, 'key.pem')
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+         '-subj', '/CN=127.0.0.1', '-keyout', key, '-out', cert],
+        check=True, capture_output=True
+    )
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def measure(get, url):
+    latencies = []
+    for _ in range(REQUESTS):
+        start = time.perf_counter()
+        get(url, verify=False).raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+
+def main():
+    warnings.simplefilter('ignore', urllib3.exceptions.InsecureRequestWarning)
+    with tempfile.TemporaryDirectory() as directory:
+        server = start_server(directory)
+        url = f'https://127.0.0.1:{server.server_port}/groups'
+
+        print(f'{REQUESTS} sequential GET requests over HTTPS')
+        print(f'{"client":>10} {"p50 (ms)":>9} {"p99 (ms)":>9}')
+        for name, get in [('requests', requests.get), ('session', session.create_session().get)]:
+            p50, p99 = measure(get, url)
+            print(f'{name:>10} {p50:>9.2f} {p99:>9.2f}')
+
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
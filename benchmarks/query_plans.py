@@ -0,0 +1,148 @@
+"""スコア取得クエリの実行計画チェック
+
+DATABASE_URL のデータベースに一時スキーマを作成してマイグレーションを適用し、
+1 シーズン相当のデータを投入して /scores_all（ビューとその再計算クエリ）、/scores_by_days、
+/matchup/scores（/teams/{team_id}/scores）の実行計画を確認する。
+enable_seqscan = off でもシーケンシャルスキャンが残るテーブルがあれば、
+結合・絞り込み列のインデックスが不足しているとして終了コード 1 で終了する。
+最後にロールバックするため、データベースには何も残らない。
+
+    DATABASE_URL=postgres://... python -m benchmarks.query_plans
+"""
+import json
+import os
+
+from benchmarks import _env  # noqa: F401
+from api import database, migrations, Ballchasing
+
+SCHEMA = 'query_plan_check'
+SEASONS = 10
+DAYS = 20
+TEAMS = 32
+PLAYERS_PER_TEAM = 3
+TABLES = ['groups', 'players', 'teams', 'cumulatives', 'cumulative_cores', 'cumulative_demos']
+
+
+def create_schema(cursor):
+    """一時スキーマを作成し、マイグレーションを適用して search_path に設定"""
+    cursor.execute(f'CREATE SCHEMA {SCHEMA}')
+    cursor.execute(f'SET LOCAL search_path TO {SCHEMA}')
+    # バージョン 4 以降は public / wide スキーマを直接指定するため、一時スキーマには 3 まで適用し、
+    # 以降のスコア取得に関わる変更は一時スキーマを指定して適用する
+    migrations.migrate(cursor, target=3)
+    cursor.execute(migrations.CREATE_SCORES_ALL_TEAM_INDEX.format(schema=SCHEMA))
+    for statement in migrations.DROP_DUPLICATE_STATS_INDEXES:
+        cursor.execute(statement.format(schema=SCHEMA))
+
+
+def seed(cursor):
+    players = TEAMS * PLAYERS_PER_TEAM
+    cursor.execute(
+        "INSERT INTO teams (id, name, bc_team_id) SELECT 't' || n, 'Team ' || n, 'bc' || n FROM generate_series(1, %s) n",
+        (TEAMS,)
+    )
+    cursor.execute(
+        """
+            INSERT INTO players (id, name, team_id, platform)
+            SELECT 'p' || n, 'Player ' || n, 'bc' || ((n - 1) / %s + 1), 'steam' FROM generate_series(1, %s) n
+        """,
+        (PLAYERS_PER_TEAM, players)
+    )
+    cursor.execute(
+        """
+            INSERT INTO groups (id, name, parent_group_id, created)
+            SELECT 's' || s, 'Season ' || s, NULL, now() FROM generate_series(1, %s) s
+            UNION ALL
+            SELECT 's' || s || 'd' || d, 'Day ' || d, 's' || s, now() + d * interval '7 days'
+            FROM generate_series(1, %s) s, generate_series(1, %s) d
+        """,
+        (SEASONS, SEASONS, DAYS)
+    )
+    cursor.execute(
+        """
+            INSERT INTO cumulatives (
+                id, group_id, player_id, games, wins, win_percentage, play_duration,
+                core_id, boost_id, movement_id, positioning_id, demo_id
+            )
+            SELECT
+                row_number() OVER (), grp.id, ply.id, 5, (random() * 5)::int, 50, 1500,
+                row_number() OVER (), 0, 0, 0, row_number() OVER ()
+            FROM groups grp CROSS JOIN players ply
+        """
+    )
+    cursor.execute(
+        """
+            INSERT INTO cumulative_cores (id, shots, goals, saves, assists, score, shooting_percentage)
+            SELECT id, 20, (random() * 20)::int, 10, 5, (random() * 4000)::int, 25 FROM cumulatives
+        """
+    )
+    cursor.execute("INSERT INTO cumulative_demos (id, inflicted, taken) SELECT id, 3, 3 FROM cumulatives")
+    database.refresh_materialized_view(cursor, 'scores_all', concurrently=False)
+    for table in TABLES + ['scores_all']:
+        cursor.execute(f'ANALYZE {table}')
+
+
+def explain(cursor, query):
+    cursor.execute(f'EXPLAIN (FORMAT JSON) {query}')
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']
+
+
+def walk(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from walk(child)
+
+
+def summarize(plan):
+    scans = []
+    for node in walk(plan):
+        if 'Relation Name' in node:
+            index = f" using {node['Index Name']}" if 'Index Name' in node else ''
+            scans.append(f"{node['Node Type']} on {node['Relation Name']}{index}")
+    return scans
+
+
+def main():
+    if 'DATABASE_URL' not in os.environ:
+        raise SystemExit('DATABASE_URL is required')
+
+    failures = []
+    with database.get_connection() as conn:
+        try:
+            with conn.cursor() as cursor:
+                create_schema(cursor)
+                seed(cursor)
+
+                cursor.execute("SELECT definition FROM pg_matviews WHERE schemaname = %s AND matviewname = 'scores_all'", (SCHEMA,))
+                queries = {
+                    '/scores_all': Ballchasing.scores_all_sql(),
+                    'scores_all refresh': cursor.fetchone()[0].rstrip().rstrip(';'),
+                    '/scores_by_days': Ballchasing.scores_by_days_sql(),
+                    '/matchup/scores': Ballchasing.scores_by_teams_sql().replace('$1', "ARRAY['t1', 't2']"),
+                }
+                for name, query in queries.items():
+                    print(f'== {name}')
+                    for scan in summarize(explain(cursor, query)):
+                        print(f'  {scan}')
+
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+                    for node in walk(explain(cursor, query)):
+                        if node['Node Type'] == 'Seq Scan':
+                            failures.append(f"{name}: Seq Scan on {node['Relation Name']}")
+                    cursor.execute('SET LOCAL enable_seqscan = on')
+        finally:
+            conn.rollback()
+
+    if failures:
+        print('missing indexes:')
+        for failure in failures:
+            print(f'  {failure}')
+        raise SystemExit(1)
+    print('ok: all score queries can use index scans')
+
+
+if __name__ == '__main__':
+    main()
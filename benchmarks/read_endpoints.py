@@ -0,0 +1,125 @@
+"""読み取りエンドポイントの負荷テスト
+
+同じ SQL を返すエンドポイントを、psycopg2 プールを使う同期版（スレッドプールで実行）と
+asyncpg プールを使う非同期版で uvicorn 上に立ち上げ、同時接続数 50 / 200 で
+p50 / p99 レイテンシとスループットを比較する。DATABASE_URL のデータベースを読み取るだけで書き込みはしない。
+
+    DATABASE_URL=postgres://... python -m benchmarks.read_endpoints
+"""
+import asyncio
+import os
+import socket
+import statistics
+import threading
+import time
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+
+from benchmarks import _env  # noqa: F401
+from api import database, async_database, Ballchasing
+
+CONCURRENCY = [50, 200]
+REQUESTS_PER_CLIENT = 10
+PATHS = ['/scores_all', '/scores_by_days', '/teams']
+SQL = {
+    '/scores_all': Ballchasing.scores_all_sql(),
+    '/scores_by_days': Ballchasing.scores_by_days_sql(),
+    '/teams': 'SELECT * FROM teams ORDER BY id',
+}
+
+
+def fetch_all_sync(sql):
+    with database.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(sql)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def create_sync_app():
+    app = FastAPI()
+    for path, sql in SQL.items():
+        def endpoint(sql=sql):
+            return {"rows": fetch_all_sync(sql)}
+        app.add_api_route(path, endpoint, methods=['GET'])
+    return app
+
+
+def create_async_app():
+    app = FastAPI()
+    for path, sql in SQL.items():
+        async def endpoint(sql=sql):
+            return {"rows": await async_database.fetch_all(sql)}
+        app.add_api_route(path, endpoint, methods=['GET'])
+    app.add_event_handler('shutdown', async_database.close_pool)
+    return app
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def serve(app):
+    port = free_port()
+    config = uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning')
+    server = uvicorn.Server(config)
+    server.install_signal_handlers = lambda: None
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread, f'http://127.0.0.1:{port}'
+
+
+async def load(base_url, concurrency):
+    latencies = []
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        for path in PATHS:
+            await client.get(path)
+
+        async def worker(index):
+            for i in range(REQUESTS_PER_CLIENT):
+                path = PATHS[(index + i) % len(PATHS)]
+                start = time.perf_counter()
+                response = await client.get(path)
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(i) for i in range(concurrency)])
+        elapsed = time.perf_counter() - start
+    return latencies, elapsed
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+    if 'DATABASE_URL' not in os.environ:
+        raise SystemExit('DATABASE_URL is required')
+    print(f"{'app':<6} {'clients':>7} {'p50 (ms)':>9} {'p99 (ms)':>9} {'mean (ms)':>10} {'req/s':>8}")
+    for name, create_app in [('sync', create_sync_app), ('async', create_async_app)]:
+        server, thread, base_url = serve(create_app())
+        try:
+            for concurrency in CONCURRENCY:
+                latencies, elapsed = asyncio.run(load(base_url, concurrency))
+                print(f'{name:<6} {concurrency:>7} '
+                      f'{percentile(latencies, 50) * 1000:>9.1f} '
+                      f'{percentile(latencies, 99) * 1000:>9.1f} '
+                      f'{statistics.mean(latencies) * 1000:>10.1f} '
+                      f'{len(latencies) / elapsed:>8.0f}')
+        finally:
+            server.should_exit = True
+            thread.join()
+    database.get_pool().closeall()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""JSON シリアライズと圧縮のベンチマーク
+
+1 シーズン分（試合日 × 選手）の /scores_by_days 相当のデータを生成し、
+FastAPI 標準の jsonable_encoder + JSONResponse と serializer.dumps（orjson）のシリアライズ時間、
+および無圧縮 / gzip / br の転送サイズと圧縮時間を比較する。
+
+    python -m benchmarks.serialization
+"""
+import datetime
+import decimal
+import random
+import time
+
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+from benchmarks import _env  # noqa: F401
+from api import serializer, compression
+
+DAYS = 20
+TEAMS = 32
+PLAYERS_PER_TEAM = 3
+REPEAT = 20
+
+
+def create_scores():
+    random.seed(0)
+    players = [f'player-{team:02d}-{number}' for team in range(TEAMS) for number in range(PLAYERS_PER_TEAM)]
+    start = datetime.datetime(2021, 4, 1, 19, 0)
+    scores = []
+    for day in range(DAYS):
+        created = start + datetime.timedelta(days=7 * day)
+        for player in players:
+            shots = random.randint(5, 40)
+            goals = random.randint(0, shots)
+            scores.append({
+                'group_name': f'Day {day + 1}',
+                'player_name': player,
+                'wins': random.randint(0, 5),
+                'score': random.randint(500, 4000),
+                'goals': goals,
+                'shots': shots,
+                'shooting_percentage': decimal.Decimal(goals * 100) / shots,
+                'assists': random.randint(0, 15),
+                'saves': random.randint(0, 30),
+                'group_created': created,
+            })
+    return {'scores': scores}
+
+
+def measure(func, repeat=REPEAT):
+    result = func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return result, (time.perf_counter() - start) / repeat
+
+
+def main():
+    content = create_scores()
+    print(f"rows: {len(content['scores'])}")
+
+    print(f"{'serializer':<28} {'time (ms)':>10} {'bytes':>10}")
+    default_body, default_time = measure(lambda: JSONResponse(jsonable_encoder(content)).body)
+    fast_body, fast_time = measure(lambda: serializer.dumps(content))
+    print(f"{'jsonable_encoder + json':<28} {default_time * 1000:>10.2f} {len(default_body):>10}")
+    print(f"{'orjson':<28} {fast_time * 1000:>10.2f} {len(fast_body):>10}")
+    print(f'speedup: {default_time / fast_time:.1f}x')
+
+    print()
+    print(f"{'encoding':<28} {'time (ms)':>10} {'bytes':>10} {'ratio':>7}")
+    print(f"{'identity':<28} {0:>10.2f} {len(fast_body):>10} {1:>7.2f}")
+    for encoding in compression.ENCODINGS:
+        body, elapsed = measure(lambda: compression.compress(fast_body, encoding))
+        print(f'{encoding:<28} {elapsed * 1000:>10.2f} {len(body):>10} {len(body) / len(fast_body):>7.2f}')
+
+
+if __name__ == '__main__':
+    main()
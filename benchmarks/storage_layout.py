@@ -0,0 +1,144 @@
+"""成績テーブルのレイアウト（normalized / wide）のベンチマーク
+
+1 シーズン分（試合日 × 選手）の ReplayGroup を生成し、レイアウトごとに
+reload_db（全件再登録）、scores_all の再計算、/scores_all と /scores_by_days のクエリの所要時間を比較する。
+DATABASE_URL のデータベースにマイグレーションを適用し、計測後はロールバックする
+（計測中は成績テーブルをロックするため、検証用のデータベースで実行すること）。
+
+    DATABASE_URL=postgres://... python -m benchmarks.storage_layout
+"""
+import os
+import random
+import statistics
+import time
+
+from benchmarks import _env  # noqa: F401
+from api import settings, database, migrations, Ballchasing
+from api.models.ballchasing import (
+    ReplayGroup, CumulativeCore, GameAverageCore, Boost, Movement, Positioning, Demo
+)
+
+DAYS = 20
+TEAMS = 32
+PLAYERS_PER_TEAM = 3
+QUERY_REPEAT = 20
+LAYOUTS = ['normalized', 'wide']
+
+
+def stats(model):
+    return {name: random.randint(0, 100) for name in model.__fields__}
+
+
+def player(number):
+    stat = {
+        'boost': stats(Boost),
+        'movement': stats(Movement),
+        'positioning': stats(Positioning),
+        'demo': stats(Demo),
+    }
+    return {
+        'platform': 'steam',
+        'id': number,
+        'name': f'player-{number}',
+        'team': f'bc-team-{number // PLAYERS_PER_TEAM}',
+        'cumulative': {
+            'games': 5,
+            'wins': random.randint(0, 5),
+            'win_percentage': 50.0,
+            'play_duration': 1500,
+            'core': stats(CumulativeCore),
+            **stat,
+        },
+        'game_average': {'core': stats(GameAverageCore), **stat},
+    }
+
+
+def replay_group(group_id):
+    return ReplayGroup(**{
+        'id': group_id,
+        'link': '',
+        'name': group_id,
+        'created': '2021-05-01T00:00:00Z',
+        'status': 'ok',
+        'player_identification': 'by-id',
+        'team_identification': 'by-player-clusters',
+        'shared': True,
+        'creator': {
+            'steam_id': 0,
+            'name': 'benchmark',
+            'profile_url': '',
+            'avatar': '',
+            'avatar_full': '',
+            'avatar_medium': '',
+        },
+        'players': [player(i) for i in range(TEAMS * PLAYERS_PER_TEAM)],
+        'teams': [],
+    })
+
+
+def create_ballchasing():
+    random.seed(0)
+    group = replay_group('season')
+    children = [replay_group(f'day-{day:02d}') for day in range(DAYS)]
+    ballchasing = Ballchasing()
+    ballchasing.get_group = lambda group_id: group
+    ballchasing.list_group_children = lambda group_id: [{'id': child.id} for child in children]
+    ballchasing.get_groups = lambda group_ids: children
+    return ballchasing
+
+
+def measure_query(cursor, query):
+    latencies = []
+    for _ in range(QUERY_REPEAT):
+        start = time.perf_counter()
+        cursor.execute(query)
+        cursor.fetchall()
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies)
+
+
+def main():
+    if 'DATABASE_URL' not in os.environ:
+        raise SystemExit('DATABASE_URL is required')
+
+    ballchasing = create_ballchasing()
+    default_layout = settings.STORAGE_LAYOUT
+    print(f'records: {(DAYS + 1) * TEAMS * PLAYERS_PER_TEAM} (group x player)')
+    print(f"{'layout':<11} {'reload (ms)':>12} {'refresh (ms)':>13} {'scores_all (ms)':>16} {'by_days (ms)':>13}")
+    with database.get_connection() as conn:
+        try:
+            with conn.cursor() as cursor:
+                migrations.migrate(cursor)
+                cursor.execute(
+                    "INSERT INTO teams (id, name, bc_team_id) "
+                    "SELECT 'team-' || n, 'Team ' || n, 'bc-team-' || n FROM generate_series(0, %s) n "
+                    "ON CONFLICT DO NOTHING",
+                    (TEAMS - 1,)
+                )
+                for layout in LAYOUTS:
+                    # ステージングテーブル（ON COMMIT DROP）と登録データはレイアウトごとに破棄し、同じ状態から計測する
+                    cursor.execute('SAVEPOINT storage_layout')
+                    settings.STORAGE_LAYOUT = layout
+                    search_path = database.SEARCH_PATHS[layout] or 'public'
+                    cursor.execute(f'SET LOCAL search_path TO {search_path}')
+
+                    start = time.perf_counter()
+                    ballchasing.reload_db(cursor, 'season')
+                    reload_time = time.perf_counter() - start
+
+                    start = time.perf_counter()
+                    Ballchasing.refresh_scores_all(cursor)
+                    refresh_time = time.perf_counter() - start
+
+                    scores_all_time = measure_query(cursor, Ballchasing.scores_all_sql())
+                    by_days_time = measure_query(cursor, Ballchasing.scores_by_days_sql())
+                    print(f'{layout:<11} {reload_time * 1000:>12.1f} {refresh_time * 1000:>13.1f} '
+                          f'{scores_all_time * 1000:>16.2f} {by_days_time * 1000:>13.2f}')
+                    cursor.execute('ROLLBACK TO SAVEPOINT storage_layout')
+        finally:
+            settings.STORAGE_LAYOUT = default_layout
+            conn.rollback()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,37 @@
 const endpoint = 'https://8vmse5.deta.dev';
 
+// GET レスポンスの検証子と内容（URL ごと）
+const responseCache = new Map();
+
 async function apiGetData(url, params) {
   let requestUrl = endpoint + url;
   if (params) {
     const queryParams = new URLSearchParams(params);
     requestUrl += `?${queryParams}`;
   }
-  const response = await fetch(requestUrl);
-  return response.json();
+
+  // 前回の ETag / Last-Modified を送り、変更がなければ 304 で前回の内容を使う
+  const cached = responseCache.get(requestUrl);
+  const headers = {};
+  if (cached) {
+    if (cached.etag) {
+      headers['If-None-Match'] = cached.etag;
+    } else if (cached.lastModified) {
+      headers['If-Modified-Since'] = cached.lastModified;
+    }
+  }
+  const response = await fetch(requestUrl, { headers, cache: 'no-store' });
+  if (response.status === 304 && cached) {
+    return cached.data;
+  }
+
+  const data = await response.json();
+  const etag = response.headers.get('ETag');
+  const lastModified = response.headers.get('Last-Modified');
+  if (response.ok && (etag || lastModified)) {
+    responseCache.set(requestUrl, { etag, lastModified, data });
+  }
+  return data;
 }
 
 async function apiPostData(url, data = {}) {
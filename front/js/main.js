@@ -14,32 +14,27 @@ const player_chart_border_colors = [
   'rgb(0, 255, 0)',
 ];
 
+// 対戦カードと両チームの選手ごとのチャート用データ（サーバー側で生成済み）
 const getScore = async () => {
-  const getTeams = apiGetData('/streaming_match');
-  const getScores = apiGetData('/scores_all');
-  const [resTeams, resScores] = await Promise.all([getTeams, getScores]);
-  if (!resTeams.teams || !resScores.scores) return;
-
-  const team1 = resTeams.teams.find(t => t.position == 1);
-  const team2 = resTeams.teams.find(t => t.position == 2);
-  const team1Scores = resScores.scores.filter(x => x.team_id == team1.team_id);
-  const team2Scores = resScores.scores.filter(x => x.team_id == team2.team_id);
+  const snapshot = await apiGetData('/overlay/snapshot');
+  if (!snapshot.team1 || !snapshot.team2) return;
+  createChart(snapshot);
+}
 
-  const chartData = {
-    team1: {
-      name: team1.team_name,
-      scores: team1Scores,
-    },
-    team2: {
-      name: team2.team_name,
-      scores: team2Scores,
-    }
-  };
-  createChart(chartData);
+// 対戦カードやスコアが更新されるとサーバーから配信される
+const subscribeScore = () => {
+  const events = new EventSource(endpoint + '/overlay/events');
+  events.addEventListener('update', (event) => {
+    const snapshot = JSON.parse(event.data);
+    if (!snapshot.team1 || !snapshot.team2) return;
+    createChart(snapshot);
+  });
 }
 
 const ctx1 = document.getElementById('chart1');
 const ctx2 = document.getElementById('chart2');
+let chart1 = null;
+let chart2 = null;
 
 const createChartOptions = (teamName) => {
   return {
@@ -74,44 +69,29 @@ const createChartOptions = (teamName) => {
   };
 }
 
-const createChartDataset = (score, index) => {
+const createChartDataset = (player, index) => {
   return {
-    label: score.player_name,
+    label: player.label,
     fontSize: 24,
     backgroundColor: player_chart_bg_colors[index],
     borderColor: player_chart_border_colors[index],
     borderWidth: 3,
     pointRadius: 0,
-    data: [
-      score.goals_parameter,
-      score.shots_parameter,
-      score.assists_parameter,
-      score.saves_parameter,
-      score.demos_parameter,
-    ]
+    data: player.data,
   };
 }
 
-const createChart = (chartData) => {
-  const labels = ['Goals', 'Shots', 'Assists', 'Saves', 'Demos'];
-  const team1Options = createChartOptions(chartData.team1.name);
-  const team2Options = createChartOptions(chartData.team2.name);
-
-  const team1Scores = chartData.team1.scores;
-  const team2Scores = chartData.team2.scores;
+const createChart = (snapshot) => {
+  const labels = snapshot.labels;
+  const team1Options = createChartOptions(snapshot.team1.name);
+  const team2Options = createChartOptions(snapshot.team2.name);
 
-  const team1Datasets = [];
-  const team2Datasets = [];
-  team1Scores.forEach((score, index) => {
-    const dataset = createChartDataset(score, index);
-    team1Datasets.push(dataset);
-  });
-  team2Scores.forEach((score, index) => {
-    const dataset = createChartDataset(score, index);
-    team2Datasets.push(dataset);
-  });
+  const team1Datasets = snapshot.team1.players.map(createChartDataset);
+  const team2Datasets = snapshot.team2.players.map(createChartDataset);
 
-  const chart1 = new Chart(ctx1, {
+  if (chart1) chart1.destroy();
+  if (chart2) chart2.destroy();
+  chart1 = new Chart(ctx1, {
     type: 'radar',
     data: {
       labels: labels,
@@ -119,7 +99,7 @@ const createChart = (chartData) => {
     },
     options: team1Options
   });
-  const chart2 = new Chart(ctx2, {
+  chart2 = new Chart(ctx2, {
     type: 'radar',
     data: {
       labels: labels,
@@ -129,4 +109,8 @@ const createChart = (chartData) => {
   });
 };
 
-getScore();
\ No newline at end of file
+if (window.EventSource) {
+  subscribeScore();
+} else {
+  getScore();
+}
\ No newline at end of file
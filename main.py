@@ -1,24 +1,294 @@
-from fastapi import FastAPI, BackgroundTasks
+from fastapi import FastAPI, BackgroundTasks, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+from psycopg2 import extras
 from pydantic import BaseModel
 
+import asyncio
 import datetime
+import email.utils
 import os
 import traceback
+import weakref
 
-from api import database, Toornament, Ballchasing
+from api import settings, database, async_database, serializer, compression, result_cache, Channel, Toornament, Ballchasing
 
-app = FastAPI()
+app = FastAPI(default_response_class=serializer.FastJSONResponse)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified"],
 )
+app.add_middleware(compression.CompressionMiddleware)
 
 tournaments = Toornament()
 ballchasing = Ballchasing()
+# 取得中のキーごとのロック（取得中・待機中のリクエストがなくなると自動で削除される）
+result_cache_locks = weakref.WeakValueDictionary()
+overlay_channel = Channel()
+overlay_task = None
+listen_task = None
+
+# オーバーレイのレーダーチャートの軸（ラベル, 項目）
+OVERLAY_CHART_AXES = [
+    ("Goals", "goals_parameter"),
+    ("Shots", "shots_parameter"),
+    ("Assists", "assists_parameter"),
+    ("Saves", "saves_parameter"),
+    ("Demos", "demos_parameter"),
+]
+
+STREAMING_MATCH_SQL = """
+    SELECT
+        sm.position,
+        sm.team_id,
+        t.name as team_name
+    FROM streaming_match sm
+    INNER JOIN teams t
+        ON sm.team_id = t.id
+    ORDER BY
+        position
+"""
+
+# 存在するチームの行だけを 1 文で更新する（更新されなかった位置があればロールバックする）
+UPDATE_STREAMING_MATCH_SQL = """
+    UPDATE streaming_match sm
+    SET team_id = v.team_id
+    FROM (VALUES %s) AS v (position, team_id)
+    INNER JOIN teams t
+        ON v.team_id = t.id
+    WHERE sm.position = v.position
+    RETURNING sm.position
+"""
+
+# チーム別のスコア取得で、指定されたチームIDのうち登録済みのもの
+KNOWN_TEAM_IDS_SQL = """
+    SELECT id FROM teams WHERE id = any($1::varchar[])
+"""
+
+
+async def get_cached_result(endpoint, fetch, params=None):
+    """キャッシュ済みの内容取得
+
+    キャッシュがなければ fetch() の結果をシリアライズして登録する。
+    同じキーの同時リクエストは 1 回だけ取得する。
+
+    Args:
+        endpoint (str): エンドポイント
+        fetch (Callable): レスポンスの内容を返すコルーチン関数
+        params (dict): パラメータ
+
+    Returns:
+        CachedResult: シリアライズ済みの内容
+    """
+    result = result_cache.get(endpoint, params)
+    if result is None:
+        key = result_cache.create_key(endpoint, params)
+        lock = result_cache_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            result = result_cache.peek(endpoint, params)
+            if result is None:
+                version, modified_at = result_cache.current()
+                content = await fetch()
+                body = serializer.dumps(content)
+                result = result_cache.put(endpoint, params, body, version, modified_at)
+    return result
+
+
+async def cached_response(request, endpoint, fetch, params=None):
+    """キャッシュ済みレスポンス取得
+
+    Accept-Encoding に応じて圧縮済みの内容を返す（圧縮結果もキャッシュする）。
+    リクエストの If-None-Match / If-Modified-Since に一致する場合は 304 を返す。
+    取得中にデータが更新された（キャッシュに登録されなかった）内容は Last-Modified を付けず、304 も返さない。
+
+    Args:
+        request (Request): リクエスト
+        endpoint (str): エンドポイント
+        fetch (Callable): レスポンスの内容を返すコルーチン関数
+        params (dict): パラメータ
+
+    Returns:
+        Response: シリアライズ済みのレスポンス
+    """
+    result = await get_cached_result(endpoint, fetch, params)
+
+    encoding = None
+    if len(result.body) >= settings.COMPRESSION_MINIMUM_SIZE:
+        encoding = compression.choose_encoding(request.headers.get("accept-encoding"))
+
+    # 圧縮形式ごとに別の表現になるため ETag も分ける
+    etag = result.etag if encoding is None else f'{result.etag[:-1]}-{encoding}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if result.last_modified is not None:
+        headers["Last-Modified"] = email.utils.formatdate(result.last_modified, usegmt=True)
+        if is_not_modified(request, etag, result.last_modified):
+            return Response(status_code=304, headers=headers)
+
+    body = result.body
+    if encoding is not None:
+        body = result.variants.get(encoding)
+        if body is None:
+            body = result.variants.setdefault(encoding, compression.compress(result.body, encoding))
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def is_not_modified(request, etag, last_modified):
+    """条件付きリクエストの判定
+
+    Args:
+        request (Request): リクエスト
+        etag (str): レスポンスの ETag
+        last_modified (int): レスポンスの最終更新日時（UNIX 時間の整数秒）
+
+    Returns:
+        bool: クライアントのキャッシュが最新の場合は True
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return last_modified <= since.timestamp()
+    return False
+
+
+def parse_fields(fields, columns):
+    """fields パラメータの解析
+
+    Args:
+        fields (str): カンマ区切りの項目名
+        columns (List[str]): 指定できる項目名
+
+    Returns:
+        List[str]: 項目名（指定がなければ None）
+    """
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in columns]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"unknown fields: {', '.join(unknown)}")
+    return names
+
+
+async def fetch_scores(sql, response_format, *args):
+    """スコア取得
+
+    Args:
+        sql (str): SQL（fields の指定は SELECT 句に反映済み）
+        response_format (str): rows（行ごとの dict）/ columnar（列ごとのリスト）
+        args: SQL のパラメータ
+
+    Returns:
+        dict: レスポンスの内容
+    """
+    if response_format == "columnar":
+        columns, data = await async_database.fetch_columns(sql, *args)
+        return {"columns": columns, "data": data}
+
+    scores = await async_database.fetch_all(sql, *args)
+    return {"scores": scores}
+
+
+async def fetch_team_scores(team_ids, field_names, response_format):
+    """チーム別のスコア取得
+
+    存在しないチームIDが含まれる場合は 404 を返す（キャッシュには登録されない）。
+    任意のチームIDでレスポンスキャッシュが埋まり、他のエンドポイントのキャッシュが追い出されるのを防ぐ。
+
+    Args:
+        team_ids (List[str]): チームID
+        field_names (List[str]): 取得する項目（None の場合は全項目）
+        response_format (str): rows / columnar
+
+    Returns:
+        dict: レスポンスの内容
+    """
+    known = {row["id"] for row in await async_database.fetch_all(KNOWN_TEAM_IDS_SQL, team_ids)}
+    unknown = [team_id for team_id in team_ids if team_id not in known]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"unknown teams: {', '.join(unknown)}")
+    return await fetch_scores(Ballchasing.scores_by_teams_sql(field_names), response_format, team_ids)
+
+
+async def build_overlay_snapshot():
+    """オーバーレイ表示データ生成
+
+    Returns:
+        dict: チャートの軸ラベルと、配信中の両チームの名前・選手ごとの正規化パラメータ
+    """
+    teams = await async_database.fetch_all(STREAMING_MATCH_SQL)
+    scores = await async_database.fetch_all(Ballchasing.scores_by_teams_sql(), [t["team_id"] for t in teams])
+    snapshot = {"labels": [label for label, _ in OVERLAY_CHART_AXES]}
+    for position in [1, 2]:
+        team = next((t for t in teams if t["position"] == position), None)
+        if team is None:
+            snapshot[f"team{position}"] = None
+            continue
+        snapshot[f"team{position}"] = {
+            "name": team["team_name"],
+            "players": [
+                {"label": x["player_name"], "data": [x[field] for _, field in OVERLAY_CHART_AXES]}
+                for x in scores if x["team_id"] == team["team_id"]
+            ],
+        }
+    return snapshot
+
+
+async def get_overlay_snapshot_body():
+    """オーバーレイ表示データ取得（データ更新まではシリアライズ済みの内容を使い回す）
+
+    Returns:
+        bytes: シリアライズ済みのオーバーレイ表示データ
+    """
+    result = await get_cached_result("/overlay/snapshot", build_overlay_snapshot)
+    return result.body
+
+
+def on_database_notify(message):
+    """他のワーカーのデータ更新の通知
+
+    更新したワーカーは自分でキャッシュを無効化済みのため、自プロセスからの通知は無視する。
+
+    Args:
+        message (str): 通知内容（再接続時は None）
+    """
+    if message is not None:
+        source, _ = database.parse_notification(message)
+        if source == database.notify_source():
+            return
+    result_cache.bump()
+
+
+@app.on_event("startup")
+async def start_overlay_channel():
+    global overlay_task, listen_task
+    result_cache.add_listener(overlay_channel.notify)
+    overlay_task = asyncio.ensure_future(overlay_channel.run(get_overlay_snapshot_body))
+    listen_task = asyncio.ensure_future(async_database.listen(settings.DB_NOTIFY_CHANNEL, on_database_notify))
+
+
+@app.on_event("shutdown")
+async def close_async_database():
+    for task in [overlay_task, listen_task]:
+        if task is not None:
+            task.cancel()
+    await async_database.close_pool()
 
 
 @app.get("/")
@@ -65,12 +335,46 @@ def get_matches(tournament_id, match_id):
     return {"match_games": data}
 
 
+@app.get("/matches/{match_id}/games")
+def get_stored_match_games(match_id):
+    try:
+        with database.get_connection() as conn:
+            with conn.cursor() as cursor:
+                sql = """
+                    SELECT
+                        number,
+                        status,
+                        opponent_number,
+                        position,
+                        result,
+                        score
+                    FROM match_games
+                    WHERE match_id = %s
+                    ORDER BY
+                        number, opponent_number
+                """
+                cursor.execute(sql, (match_id,))
+                columns = [column[0] for column in cursor.description]
+                match_games = []
+                for row in cursor.fetchall():
+                    match_games.append(dict(zip(columns, row)))
+                return {"match_games": match_games}
+    except:
+        st = traceback.format_exc()
+        return {"error": st}
+
+
 @app.get("/replay/groups/{group_id}")
 def get_replay_group(group_id):
     data = ballchasing.get_group(group_id)
     return {"replay_group": data}
 
 
+@app.get("/replay/rate_limit")
+def get_replay_rate_limit():
+    return {"rate_limit": ballchasing.rate_limiter.stats()}
+
+
 @app.get("/replay/get_group_children/{group_id}")
 def get_group_children(group_id):
     data = ballchasing.get_group_children(group_id)
@@ -101,77 +405,199 @@ async def init_db(tournament_id, group_id, background_tasks: BackgroundTasks):
     return {"status": "DBの初期化を開始しました。"}
 
 
+@app.get("/sync_db/{group_id}")
+async def sync_db(group_id, background_tasks: BackgroundTasks):
+    try:
+        with database.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"SELECT NEXTVAL('background_task_id_seq')")
+                background_task_id = cursor.fetchone()[0]
+                values = (background_task_id, 'api request', datetime.datetime.now())
+                cursor.execute("INSERT INTO background_tasks (id, status, created_at) VALUES (%s, %s, %s)", values)
+    except:
+        st = traceback.format_exc()
+        return {
+            "status": "DBの接続に失敗しました。",
+            "error": st
+        }
+
+    background_tasks.add_task(ballchasing.init_db, group_id, background_task_id, incremental=True)
+    return {"status": "DBの差分同期を開始しました。"}
+
+
 @app.get("/scores_by_days")
-def get_scores_by_days():
+async def get_scores_by_days(
+    request: Request,
+    response_format: str = Query("rows", alias="format", regex="^(rows|columnar)$"),
+    fields: str = None,
+):
+    field_names = parse_fields(fields, Ballchasing.SCORES_BY_DAYS_COLUMNS)
+
+    async def fetch():
+        return await fetch_scores(Ballchasing.scores_by_days_sql(field_names), response_format)
+
     try:
-        scores = ballchasing.get_scores_by_days()
-        return {"scores": scores}
+        params = {"format": response_format, "fields": ",".join(field_names or [])}
+        return await cached_response(request, "/scores_by_days", fetch, params)
     except:
         st = traceback.format_exc()
         return {"error": st}
 
 
 @app.get("/scores_all")
-def get_scores_all():
+async def get_scores_all(
+    request: Request,
+    response_format: str = Query("rows", alias="format", regex="^(rows|columnar)$"),
+    fields: str = None,
+):
+    field_names = parse_fields(fields, Ballchasing.SCORES_ALL_COLUMNS)
+
+    async def fetch():
+        return await fetch_scores(Ballchasing.scores_all_sql(field_names), response_format)
+
     try:
-        scores = ballchasing.get_scores_all()
-        return {"scores": scores}
+        params = {"format": response_format, "fields": ",".join(field_names or [])}
+        return await cached_response(request, "/scores_all", fetch, params)
     except:
         st = traceback.format_exc()
         return {"error": st}
 
 
+@app.get("/teams/{team_id}/scores")
+async def get_team_scores(
+    team_id: str,
+    request: Request,
+    response_format: str = Query("rows", alias="format", regex="^(rows|columnar)$"),
+    fields: str = None,
+):
+    field_names = parse_fields(fields, Ballchasing.SCORES_ALL_COLUMNS)
+
+    async def fetch():
+        return await fetch_team_scores([team_id], field_names, response_format)
+
+    try:
+        params = {"team_id": team_id, "format": response_format, "fields": ",".join(field_names or [])}
+        return await cached_response(request, "/teams/scores", fetch, params)
+    except HTTPException:
+        raise
+    except:
+        st = traceback.format_exc()
+        return {"error": st}
+
+
+@app.get("/matchup/scores")
+async def get_matchup_scores(
+    request: Request,
+    team1: str,
+    team2: str,
+    response_format: str = Query("rows", alias="format", regex="^(rows|columnar)$"),
+    fields: str = None,
+):
+    field_names = parse_fields(fields, Ballchasing.SCORES_ALL_COLUMNS)
+
+    async def fetch():
+        return await fetch_team_scores([team1, team2], field_names, response_format)
+
+    try:
+        params = {"team1": team1, "team2": team2, "format": response_format, "fields": ",".join(field_names or [])}
+        return await cached_response(request, "/matchup/scores", fetch, params)
+    except HTTPException:
+        raise
+    except:
+        st = traceback.format_exc()
+        return {"error": st}
+
+
+@app.get("/db/pool")
+def get_db_pool():
+    return {"pool": database.get_pool().stats()}
+
+
+@app.get("/cache/results")
+def get_result_cache():
+    return {"result_cache": result_cache.stats()}
+
+
 @app.get("/teams")
-def get_teams():
+async def get_teams(request: Request):
+    async def fetch():
+        teams = await async_database.fetch_all("SELECT * FROM teams ORDER BY id")
+        return {"teams": teams}
+
     try:
-        with database.get_connection() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute(f"SELECT * FROM teams ORDER BY id")
-                columns = [column[0] for column in cursor.description]
-                teams = []
-                for row in cursor.fetchall():
-                    teams.append(dict(zip(columns, row)))
-                return {"teams": teams}
+        return await cached_response(request, "/teams", fetch)
     except:
         st = traceback.format_exc()
         return {"error": st}
 
 
 @app.get("/streaming_match")
-def get_streaming_match():
+async def get_streaming_match(request: Request):
+    async def fetch():
+        teams = await async_database.fetch_all(STREAMING_MATCH_SQL)
+        return {"teams": teams}
+
     try:
-        with database.get_connection() as conn:
-            with conn.cursor() as cursor:
-                sql = """
-                    SELECT
-                        sm.position,
-                        sm.team_id,
-                        t.name as team_name
-                    FROM streaming_match sm
-                    INNER JOIN teams t
-                        ON sm.team_id = t.id
-                    ORDER BY
-                        position
-                """
-                cursor.execute(sql)
-                columns = [column[0] for column in cursor.description]
-                teams = []
-                for row in cursor.fetchall():
-                    teams.append(dict(zip(columns, row)))
-                return {"teams": teams}
+        return await cached_response(request, "/streaming_match", fetch)
+    except:
+        st = traceback.format_exc()
+        return {"error": st}
+
+
+@app.get("/overlay/events")
+async def get_overlay_events():
+    queue = overlay_channel.subscribe()
+
+    async def stream():
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=settings.OVERLAY_KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+        finally:
+            overlay_channel.unsubscribe(queue)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(stream(), media_type="text/event-stream", headers=headers)
+
+
+@app.get("/overlay/snapshot")
+async def get_overlay_snapshot(request: Request):
+    try:
+        return await cached_response(request, "/overlay/snapshot", build_overlay_snapshot)
     except:
         st = traceback.format_exc()
         return {"error": st}
 
 
+@app.get("/overlay/clients")
+def get_overlay_clients():
+    return {"overlay": overlay_channel.stats()}
+
+
 @app.post("/streaming_match")
 def set_streaming_match(teams: list):
     try:
+        values = [(int(team['position']), str(team['id'])) for team in teams]
+        positions = [position for position, _ in values]
+        if not values or len(set(positions)) != len(positions):
+            raise ValueError(f"invalid positions: {positions}")
+
         with database.get_connection() as conn:
             with conn.cursor() as cursor:
-                for team in teams:
-                    cursor.execute("UPDATE streaming_match SET team_id = %s WHERE position = %s", (team['id'], team['position']))
+                updated = extras.execute_values(cursor, UPDATE_STREAMING_MATCH_SQL, values, fetch=True)
+                missing = set(positions) - {row[0] for row in updated}
+                if missing:
+                    raise ValueError(f"unknown team or position: {[v for v in values if v[0] in missing]}")
+                database.notify(cursor, "streaming_match")
+        result_cache.bump()
         return {"status": "success"}
+    except ValueError as e:
+        return {
+            "status": "error",
+            "error": str(e)
+        }
     except:
         st = traceback.format_exc()
         return {
@@ -0,0 +1,69 @@
+"""BULK INSERT のローダー（COPY / INSERT ... VALUES）のテスト
+
+セッションの TimeZone を UTC 以外にして、両方のローダーで同じ値が登録されることを確認する。
+一時テーブルを使い、最後にロールバックする。DATABASE_URL がなければスキップする。
+
+    DATABASE_URL=postgres://... python -m pytest tests
+"""
+import datetime
+import os
+from types import SimpleNamespace
+
+import pytest
+
+pytestmark = pytest.mark.skipif('DATABASE_URL' not in os.environ, reason='DATABASE_URL is not set')
+
+from api import database, Ballchasing  # noqa: E402
+
+LOADERS = ['copy', 'values']
+CREATED = datetime.datetime(2021, 5, 1, 12, 30, tzinfo=datetime.timezone(datetime.timedelta(hours=-5)))
+
+
+@pytest.fixture
+def cursor():
+    with database.get_connection() as conn:
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SET LOCAL TimeZone TO 'Asia/Tokyo'")
+                yield cursor
+        finally:
+            conn.rollback()
+
+
+def load(cursor, ddl, columns, rows, upsert=False):
+    """ローダーごとに一時テーブルへ登録
+
+    Returns:
+        dict: ローダー名と登録された行
+    """
+    loaded = {}
+    for loader in LOADERS:
+        table = f'loader_{loader}'
+        cursor.execute(f'CREATE TEMP TABLE {table} ({ddl}) ON COMMIT DROP')
+        if upsert:
+            database.bulk_upsert(cursor, table, columns, rows, loader=loader)
+        else:
+            database.bulk_insert(cursor, table, columns, rows, loader=loader)
+        cursor.execute(f'SELECT {", ".join(columns)} FROM {table} ORDER BY 1')
+        loaded[loader] = cursor.fetchall()
+    return loaded
+
+
+@pytest.mark.parametrize('upsert', [False, True])
+def test_group_created_is_stored_as_utc(cursor, upsert):
+    group = SimpleNamespace(id='g1', name='group', created=CREATED)
+    rows = []
+    Ballchasing().init_db_group(cursor, group, None, rows)
+
+    loaded = load(cursor, 'id varchar PRIMARY KEY, name varchar, parent_group_id varchar, created timestamp',
+                  Ballchasing.GROUP_COLUMNS, rows, upsert=upsert)
+
+    assert loaded['copy'] == loaded['values']
+    assert loaded['copy'][0][3] == datetime.datetime(2021, 5, 1, 17, 30)
+
+
+def test_timestamptz_keeps_instant(cursor):
+    loaded = load(cursor, 'id integer PRIMARY KEY, played_at timestamptz', ['id', 'played_at'], [(1, CREATED)])
+
+    assert loaded['copy'] == loaded['values']
+    assert loaded['copy'][0][1] == CREATED
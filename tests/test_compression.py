@@ -0,0 +1,56 @@
+"""レスポンス圧縮のテスト
+
+CompressionMiddleware を付けた最小のアプリに Accept-Encoding を変えてリクエストし、
+選ばれた圧縮形式でレスポンスが返ることを確認する。
+"""
+import gzip
+import json
+
+import brotli
+import pytest
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+
+from api import compression
+
+BODY = {'scores': [{'player_name': f'player-{i}', 'score': i} for i in range(200)]}
+
+
+@pytest.fixture(scope='module')
+def client():
+    app = FastAPI()
+    app.add_middleware(compression.CompressionMiddleware, minimum_size=0)
+
+    @app.get('/scores')
+    def scores():
+        return BODY
+
+    return TestClient(app)
+
+
+def get(client, accept_encoding):
+    # 圧縮したままの本文を確認するため、requests による自動展開を使わない
+    response = client.get('/scores', headers={'Accept-Encoding': accept_encoding}, stream=True)
+    return response, response.raw.read(decode_content=False)
+
+
+def test_br_request_gets_br_response(client):
+    response, body = get(client, 'gzip, deflate, br')
+
+    assert response.headers['content-encoding'] == 'br'
+    assert response.headers['vary'] == 'Accept-Encoding'
+    assert json.loads(brotli.decompress(body)) == BODY
+
+
+def test_gzip_request_gets_gzip_response(client):
+    response, body = get(client, 'gzip')
+
+    assert response.headers['content-encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(body)) == BODY
+
+
+def test_identity_request_is_not_compressed(client):
+    response, body = get(client, 'identity')
+
+    assert 'content-encoding' not in response.headers
+    assert json.loads(body) == BODY
@@ -0,0 +1,43 @@
+"""コネクションプールの fork 対応のテスト
+
+fork した子プロセスでプールを作り直し、引き継いだプールを閉じても、
+親プロセスの接続が使えることを確認する。DATABASE_URL がなければスキップする。
+"""
+import gc
+import os
+
+import pytest
+
+pytestmark = [
+    pytest.mark.skipif('DATABASE_URL' not in os.environ, reason='DATABASE_URL is not set'),
+    pytest.mark.skipif(not hasattr(os, 'fork'), reason='os.fork is not available'),
+]
+
+from api import database  # noqa: E402
+
+
+def backend_pid():
+    with database.get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            return cursor.fetchone()[0]
+
+
+def test_parent_connection_survives_child_pool():
+    parent_backend_pid = backend_pid()
+    inherited = database.get_pool()
+
+    pid = os.fork()
+    if pid == 0:
+        # 子プロセス: 新しい接続で問い合わせてから、引き継いだプールを閉じて終了する
+        try:
+            code = 0 if backend_pid() != parent_backend_pid else 1
+            inherited.closeall()
+            gc.collect()
+        except BaseException:
+            code = 2
+        os._exit(code)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert backend_pid() == parent_backend_pid
@@ -0,0 +1,81 @@
+"""スコア取得クエリの実行計画のテスト
+
+DATABASE_URL のデータベースに一時スキーマを作成し、1 リーグ分（benchmarks.query_plans と同じ規模）の
+データを投入して、プランナーの設定を既定のまま EXPLAIN した実行計画を確認する。
+最後にロールバックするため、データベースには何も残らない。DATABASE_URL がなければスキップする。
+
+    DATABASE_URL=postgres://... python -m pytest tests
+"""
+import os
+
+import pytest
+
+pytestmark = pytest.mark.skipif('DATABASE_URL' not in os.environ, reason='DATABASE_URL is not set')
+
+from api import database, Ballchasing  # noqa: E402
+from benchmarks.query_plans import SCHEMA, create_schema, seed, explain, walk  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def cursor():
+    with database.get_connection() as conn:
+        try:
+            with conn.cursor() as cursor:
+                create_schema(cursor)
+                seed(cursor)
+                yield cursor
+        finally:
+            conn.rollback()
+
+
+def scans(plan):
+    """実行計画のスキャン一覧
+
+    Returns:
+        List[tuple]: (ノード種別, テーブル名, インデックス名)
+    """
+    return [
+        (node['Node Type'], node.get('Relation Name'), node.get('Index Name'))
+        for node in walk(plan)
+        if 'Relation Name' in node or 'Index Name' in node
+    ]
+
+
+def team_scores_sql(team_ids):
+    return Ballchasing.scores_by_teams_sql().replace('$1', 'ARRAY[{}]'.format(', '.join(f"'{x}'" for x in team_ids)))
+
+
+@pytest.mark.parametrize('team_ids', [['t1'], ['t1', 't2']])
+def test_team_scores_use_team_index(cursor, team_ids):
+    plan = scans(explain(cursor, team_scores_sql(team_ids)))
+
+    assert any(index == 'scores_all_team_id_idx' for _, _, index in plan), plan
+    assert ('Seq Scan', 'scores_all', None) not in plan, plan
+
+
+def test_scores_all_refresh_looks_up_stats_by_id(cursor):
+    cursor.execute("SELECT definition FROM pg_matviews WHERE schemaname = %s AND matviewname = 'scores_all'", (SCHEMA,))
+    plan = scans(explain(cursor, cursor.fetchone()[0].rstrip().rstrip(';')))
+
+    # 親グループの累計成績だけを ID で引く（全件のうち 1 / (DAYS + 1) 件）
+    for table in ['cumulative_cores', 'cumulative_demos']:
+        assert ('Index Scan', table, f'{table}_pkey') in plan, plan
+        assert ('Seq Scan', table, None) not in plan, plan
+
+
+def test_scores_by_days_reads_each_table_once(cursor):
+    plan = explain(cursor, Ballchasing.scores_by_days_sql())
+    tables = [table for _, table, _ in scans(plan)]
+
+    # 子グループの成績をほぼ全件読むため、結合ごとに表を引き直さず各テーブルを 1 回ずつ読む
+    assert sorted(tables) == ['cumulative_cores', 'cumulatives', 'groups', 'players'], tables
+    for node in walk(plan):
+        if node['Node Type'] == 'Nested Loop':
+            inner = node['Plans'][1]
+            assert all(child['Node Type'] != 'Seq Scan' for child in walk(inner)), scans(plan)
+
+
+def test_scores_all_reads_only_the_view(cursor):
+    plan = scans(explain(cursor, Ballchasing.scores_all_sql()))
+
+    assert {table for _, table, _ in plan} == {'scores_all'}, plan
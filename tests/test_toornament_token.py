@@ -0,0 +1,44 @@
+"""Toornament のアクセストークンキャッシュのテスト
+
+認証リクエストはスタブのセッションで置き換え、外部 API には接続しない。
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from api import settings
+from api.toornament import Toornament
+
+
+class AuthSession:
+    """認証リクエストの回数を数えるスタブ"""
+
+    def __init__(self, expires_in):
+        self.expires_in = expires_in
+        self.count = 0
+
+    def post(self, url, data, timeout):
+        self.count += 1
+        body = {'access_token': f'token-{self.count}', 'expires_in': self.expires_in}
+        return SimpleNamespace(raise_for_status=lambda: None, json=lambda: body)
+
+
+@pytest.mark.parametrize('expires_in', [30, settings.TOORNAMENT_TOKEN_MARGIN, 3600])
+def test_token_is_reused_until_it_expires(expires_in):
+    toornament = Toornament()
+    toornament.session = AuthSession(expires_in)
+
+    tokens = [toornament.get_access_token() for _ in range(3)]
+
+    assert tokens == ['token-1'] * 3
+    assert toornament.session.count == 1
+
+
+def test_expired_token_is_refreshed():
+    toornament = Toornament()
+    toornament.session = AuthSession(3600)
+
+    token = toornament.get_access_token()
+
+    assert toornament.get_access_token(expired_token=token) == 'token-2'
+    assert toornament.get_access_token(expired_token=token) == 'token-2'